@@ -0,0 +1,19 @@
+import argparse
+import json
+from pathlib import Path
+
+from src.simulator import CostModel, loadTrace, simulate
+
+arg_parser = argparse.ArgumentParser(description="AI Model Juggler swap policy simulator")
+arg_parser.add_argument("--config", "-c", type=str, default="config.json", help="Path to the configuration file")
+arg_parser.add_argument("--trace", "-t", type=str, required=True, help="Path to the request trace (.csv or JSON lines)")
+arg_parser.add_argument("--costs", type=str, default=None, help="Path to the JSON file with the cost distributions")
+arg_parser.add_argument("--seed", type=int, default=None, help="Random seed for sampling the costs")
+arguments = arg_parser.parse_args()
+
+costs = {}
+if arguments.costs is not None:
+    with open(arguments.costs, 'r') as file:
+        costs = json.load(file)
+
+simulate(Path(arguments.config), loadTrace(Path(arguments.trace)), CostModel(costs, arguments.seed))
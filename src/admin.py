@@ -0,0 +1,191 @@
+import hmac
+import http.server
+import json
+import math
+import socketserver
+
+from typing import Any, Dict, Tuple
+
+from .aibackendmanager import getBackendManager
+from .config import AdminConfig
+from .memorymonitor import getMemoryMonitor
+
+
+class AdminAPIHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if not self.authorize():
+            return
+
+        if self.path.partition('?')[0] == '/residency':
+            self.send_json(200, self.residency())
+        else:
+            self.send_json(404, {'error': f"Unknown admin path '{self.path}'."})
+
+    def do_POST(self):
+        if not self.authorize():
+            return
+
+        # the optional fields each action takes, besides the endpoint
+        actions = {
+            '/preload':  (self.preload,  {'pin': float}),
+            '/pin':      (self.pin,      {'seconds': float}),
+            '/unpin':    (self.unpin,    {}),
+            '/evict':    (self.evict,    {'force': bool}),
+            '/drain':    (self.drain,    {'timeout': float}),
+            '/snapshot': (self.snapshot, {}),
+        }
+
+        if self.path.partition('?')[0] not in actions:
+            self.send_json(404, {'error': f"Unknown admin path '{self.path}'."})
+            return
+
+        action, fields = actions[self.path.partition('?')[0]]
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            validateRequest(request, fields)
+
+            # unknown endpoints are rejected before anything is changed
+            if request['endpoint'] not in getBackendManager().getBackends():
+                self.send_json(404, {'error': f"Backend for server:endpoint '{request['endpoint']}' not found."})
+                return
+
+            status, response = action(request['endpoint'], request)
+
+        except (ValueError, TypeError) as error:
+            self.send_json(400, {'error': str(error)})
+            return
+
+        self.send_json(status, response)
+
+    def authorize(self) -> bool:
+        token: str = getattr(self.server, 'admin_config').token
+        scheme, _, credentials = self.headers.get('Authorization', '').partition(' ')
+
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode('utf-8'), token.encode('utf-8')):
+            return True
+
+        body = json.dumps({'error': "Unauthorized"}).encode('utf-8')
+        self.send_response(401)
+        self.send_header('WWW-Authenticate', 'Bearer')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return False
+
+    def send_json(self, status: int, data: Dict):
+        body = json.dumps(data).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def residency(self) -> Dict:
+        manager = getBackendManager()
+        monitor = getMemoryMonitor()
+        footprint = monitor.footprint() if monitor is not None else {}
+        now = manager.clock()
+
+        backends = {}
+        for server_endpoint, backend in manager.getBackends().items():
+            breaker = manager.getCircuitBreaker(server_endpoint)
+            last_used = manager.getLastUsed(server_endpoint)
+
+            backends[server_endpoint] = {
+                'residency': manager.getResidency(server_endpoint).value,
+                'active': manager.getActive() == server_endpoint,
+                'running': backend.isRunning() or backend.isAttached(),
+                'pinned_for': manager.pinnedFor(server_endpoint),
+                'idle_seconds': now - last_used if last_used is not None else None,
+                'expected_swap_seconds': manager.expectedSwapSeconds(server_endpoint),
+                'memory_bytes': footprint.get(server_endpoint),
+                'failures': breaker.failures,
+                'retry_after': breaker.retryAfter(),
+                'last_error': breaker.last_error,
+            }
+
+        return {'active': manager.getActive(), 'backends': backends}
+
+    def preload(self, server_endpoint: str, request: Dict[str, Any]) -> Tuple[int, Dict]:
+        manager = getBackendManager()
+
+        # checked before anything is evicted
+        if request.get('pin') is not None and request['pin'] <= 0:
+            raise ValueError("'pin' must be a positive number.")
+
+        if manager.getBackend(server_endpoint) is False:
+            message, retry_after = manager.getUnavailability(server_endpoint)
+            return 503, {'error': message, 'retry_after': retry_after}
+
+        if request.get('pin') is not None:
+            manager.pin(server_endpoint, request['pin'])
+
+        return 200, self.residency()['backends'][server_endpoint]
+
+    def pin(self, server_endpoint: str, request: Dict[str, Any]) -> Tuple[int, Dict]:
+        if request.get('seconds') is None or request['seconds'] <= 0:
+            raise ValueError("'seconds' must be a positive number.")
+
+        getBackendManager().pin(server_endpoint, request['seconds'])
+        return 200, {'pinned_for': getBackendManager().pinnedFor(server_endpoint)}
+
+    def unpin(self, server_endpoint: str, request: Dict[str, Any]) -> Tuple[int, Dict]:
+        getBackendManager().unpin(server_endpoint)
+        return 200, {'pinned_for': 0.0}
+
+    def evict(self, server_endpoint: str, request: Dict[str, Any]) -> Tuple[int, Dict]:
+        # unloads the model, or shuts the backend down with force
+        manager = getBackendManager()
+        manager.unpin(server_endpoint)
+        manager.stopBackend(server_endpoint, force=request.get('force') is True)
+
+        return 200, {'residency': manager.getResidency(server_endpoint).value}
+
+    def drain(self, server_endpoint: str, request: Dict[str, Any]) -> Tuple[int, Dict]:
+        manager = getBackendManager()
+        timeout = request.get('timeout', manager.getBackends()[server_endpoint].eviction_wait)
+        if timeout is None or timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number.")
+
+        # the answer is sent once the model is unloaded
+        idle = manager.drain(server_endpoint, timeout)
+
+        return 200, {'idle': idle, 'residency': manager.getResidency(server_endpoint).value}
+
+    def snapshot(self, server_endpoint: str, request: Dict[str, Any]) -> Tuple[int, Dict]:
+        if not getBackendManager().snapshotKVCache(server_endpoint):
+            return 409, {'error': "The backend is not loaded or does not save its KV cache."}
+
+        return 200, {'saved': True}
+
+
+def validateRequest(request: Any, fields: Dict[str, type]):
+    if not isinstance(request, dict) or not isinstance(request.get('endpoint'), str):
+        raise ValueError("The request must be a JSON object with a \"server:endpoint\" string as 'endpoint'.")
+
+    for name, value in request.items():
+        if name == 'endpoint':
+            continue
+
+        if name not in fields:
+            raise ValueError(f"Unknown field '{name}'.")
+
+        if value is None:
+            continue
+
+        # booleans are integers to Python, but not a number of seconds
+        if fields[name] is float and (isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)):
+            raise ValueError(f"'{name}' must be a finite number.")
+
+        if fields[name] is bool and not isinstance(value, bool):
+            raise ValueError(f"'{name}' must be true or false.")
+
+def run_admin_server(config: AdminConfig):
+    with socketserver.ThreadingTCPServer((config.host, config.port), AdminAPIHandler) as httpd:
+        setattr(httpd, 'admin_config', config)
+        print(f"Admin API running on {config.host}:{config.port}")
+        httpd.serve_forever()
@@ -1,9 +1,11 @@
 import socket
+import threading
 import time
 
+from collections import deque
 from pathlib import Path
 from subprocess import Popen, PIPE
-from typing import Dict, List
+from typing import Deque, Dict, IO, List
 
 from .config import AIBackendConfig, EndpointConfig, getConfig, ServerConfig
 
@@ -13,6 +15,13 @@ def free_port():
         return s.getsockname()[1]
 
 
+# state of a backend process that the endpoints of several backend instances take turns on
+class SharedService:
+    def __init__(self):
+        self.owner: 'AIBackend|None' = None
+        self.members: List['AIBackend'] = []
+
+
 class AIBackend:
     supports_executing_directly            = False
     supports_attaching_to_running_instance = False
@@ -29,6 +38,7 @@ class AIBackend:
         self.type = config.type
         self.service_name = f"{self.type} backend ({server.name}, {endpoint.name})"
         self.endpoint = endpoint
+        self.runs_on_cpu = endpoint.runs_on_cpu
 
         self.service_binary = config.binary
         self.service_parameters = config.default_parameters + endpoint.parameters
@@ -37,12 +47,22 @@ class AIBackend:
         self._is_attached = False
 
         self.model_unloading = config.model_unloading
+        self.eviction_wait = config.eviction_wait
+        self.pending_unload = False
+        self._unload_lock = threading.RLock()
+        self._unload_generation = 0
 
         self.kv_cache_save_path = getConfig().temp_dir / 'kv_cache' if endpoint.kv_cache_saving else None
 
         self.initial_startup_delay = 0.15  # seconds
         self.subsequent_startup_delay = 0.3  # seconds
         self.startup_delay_multiplier = 1.1
+        self.startup_timeout = endpoint.startup_timeout  # seconds
+        self.probe_timeout = 5.0  # seconds
+        self.queue_poll_interval = 1.0  # seconds
+
+        self.stderr_tail: Deque[str] = deque(maxlen=20)
+        self.last_error: str|None = None
 
     def isRunning(self) -> bool:
         if self.service_process is None:
@@ -59,6 +79,9 @@ class AIBackend:
     def isAttached(self) -> bool:
         return self._is_attached
 
+    def sharesServiceWith(self, other: 'AIBackend') -> bool:
+        return False
+
 
     def isReady(self) -> bool:
         if self.isAttached() is True:
@@ -86,7 +109,7 @@ class AIBackend:
         print(f"{self.service_name} stopped.")
 
 
-    def stopService(self, force: bool = False):
+    def stopService(self, force: bool = False, successor: 'AIBackend|None' = None):
         if not self.isRunning() and not self.isAttached():
             return
 
@@ -94,15 +117,78 @@ class AIBackend:
             self.saveKVCache()
 
         if not force and self.model_unloading is True:
-            self.unloadModel()
+            if self.queueDepth() > 0:
+                self._scheduleUnload(successor)
+            else:
+                self.unloadModel(successor)
 
         else:
             self.shutdown()
 
+    def queueDepth(self) -> int:
+        return 0
+
+    def measureThroughput(self) -> float|None:
+        return None
+
+    def waitForIdle(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.queueDepth() > 0:
+            if time.monotonic() >= deadline:
+                return False
+
+            time.sleep(self.queue_poll_interval)
+
+        return True
+
+    def _scheduleUnload(self, successor: 'AIBackend|None' = None):
+        with self._unload_lock:
+            if self.pending_unload:
+                return
+
+            self.pending_unload = True
+            self._unload_generation += 1
+            generation = self._unload_generation
+
+        print(f"{self.service_name} is busy. Unloading the model once the current jobs are done.")
+
+        def unloadWhenIdle():
+            while self.pending_unload and self._unload_generation == generation and self.queueDepth() > 0:
+                time.sleep(self.queue_poll_interval)
+
+            # readying the backend again cancels the pending unload, a later one is left to its own thread
+            with self._unload_lock:
+                if self.pending_unload and self._unload_generation == generation:
+                    self.pending_unload = False
+                    self.unloadModel(successor)
+
+        threading.Thread(target=unloadWhenIdle, daemon=True).start()
+
+    def _cancelUnload(self):
+        # an unload that already started is waited for, so it can't unload the model from under the next request
+        with self._unload_lock:
+            self.pending_unload = False
+
+    def _takeOverService(self, shared: SharedService):
+        host = shared.owner
+        if host is not None and host is not self:
+            self.service_process = host.service_process
+            self.backend_port = host.backend_port
+            host._releaseService()
+
+        shared.owner = self
+
+    def _releaseService(self):
+        self.service_process = None
+        self.is_ready = False
+        self.backend_port = None
+        self._is_attached = False
+        self._cancelUnload()
+
     def attachInstance(self) -> bool:
         raise NotImplementedError(f"Instance attachment is not implemented for {type(self).__name__} backend.")
 
-    def unloadModel(self):
+    def unloadModel(self, successor: 'AIBackend|None' = None):
         raise NotImplementedError("Model unloading is not implemented for this backend.")
 
     def saveKVCache(self) -> bool:
@@ -113,6 +199,8 @@ class AIBackend:
 
 
     def readyService(self) -> bool:
+        self._cancelUnload()
+
         if self.isAttached():
             return True
 
@@ -126,8 +214,7 @@ class AIBackend:
         if self.service_binary is not None:
             return self.startService()
 
-        print(f"Service {self.type} binary is not set and no instance is attached.")
-        return False
+        return self._fail(f"Service {self.type} binary is not set and no instance is attached.")
 
 
     def startService(self) -> bool:
@@ -137,8 +224,7 @@ class AIBackend:
             return True
 
         if not Path(self._getServiceBinaryPath()).exists():
-            print(f"Service binary {self.service_binary} does not exist.")
-            return False
+            return self._fail(f"Service binary {self.service_binary} does not exist.")
 
         print(f"Starting {self.service_name}...")
 
@@ -154,15 +240,21 @@ class AIBackend:
                 bufsize=1,
                 env=self._modifyEnvironment())
 
-        time.sleep(self.initial_startup_delay)  # give the service some time to start
+        # the pipes have to be drained, or the service blocks once they are full
+        self.stderr_tail.clear()
+        threading.Thread(target=self._drainOutput, args=(self.service_process.stdout, None), daemon=True).start()
+        threading.Thread(target=self._drainOutput, args=(self.service_process.stderr, self.stderr_tail), daemon=True).start()
 
-        if not self.isRunning():
-            print("Service failed to start.")
-            return False
+        deadline = elapsed_time_reference + self.startup_timeout
 
+        time.sleep(self.initial_startup_delay)  # give the service some time to start
 
         delay = self.startup_delay_multiplier
         while True:
+            exit_code = self.service_process.poll() if self.service_process is not None else None
+            if not self.isRunning():
+                return self._fail(f"{self.service_name} exited during start up (exit code {exit_code}).", with_output=True)
+
             if self.isReady():
                 if self.kv_cache_save_path is not None:
                     self.restoreKVCache()
@@ -176,10 +268,31 @@ class AIBackend:
                 return True
 
 
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.shutdown()
+                return self._fail(f"{self.service_name} did not become ready within {self.startup_timeout} seconds.", with_output=True)
+
             # wait for the service to be ready
-            time.sleep(delay)
+            time.sleep(min(delay, remaining))
             delay *= self.startup_delay_multiplier
 
+    def _drainOutput(self, stream: IO[str]|None, tail: Deque[str]|None):
+        if stream is None:
+            return
+
+        for line in stream:
+            if tail is not None:
+                tail.append(line.rstrip())
+
+    def _fail(self, message: str, with_output: bool = False) -> bool:
+        if with_output and len(self.stderr_tail) > 0:
+            message += "\n" + "\n".join(self.stderr_tail)
+
+        self.last_error = message
+        print(message)
+        return False
+
     def backendURL(self) -> str:
         if not self.isRunning():
             raise RuntimeError("Service is not running.")
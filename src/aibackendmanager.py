@@ -1,35 +1,459 @@
-from typing import Dict, Literal, Type
+import threading
+import time
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, List, Literal, Tuple, Type
 
 from .aibackend import AIBackend
+from .cpufallback import expectedCPUSeconds, RequestEstimate
+
+class Residency(Enum):
+    COLD      = 'cold'
+    STARTING  = 'starting'
+    HOT       = 'hot'
+    UNLOADING = 'unloading'
+
+
+@dataclass
+class CircuitBreaker:
+    failures: int = 0
+    open_until: float = 0.0
+    last_error: str|None = None
+    clock: Callable[[], float] = time.monotonic
+
+    def isOpen(self) -> bool:
+        return self.clock() < self.open_until
+
+    def retryAfter(self) -> float:
+        return max(0.0, self.open_until - self.clock())
+
 
 class AIBackendManager:
-    def __init__(self):
+    def __init__(self, clock: Callable[[], float] = time.monotonic, background_retries: bool = True):
+        # the simulator runs the manager in simulated time
+        self.clock = clock
+        self.background_retries = background_retries
+
         self._backends: Dict[str, AIBackend] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._residency: Dict[str, Residency] = {}
+        self._last_used: Dict[str, float] = {}
+        self._active: str|None = None
+        self._lock = threading.RLock()
+        self._ready_listeners: List[Callable[[str, AIBackend], None]] = []
+        self._cpu_fallbacks: Dict[str, str] = {}
+        self._cpu_throughput: Dict[str, float] = {}
+        self._throughput_sampled_at: Dict[str, float] = {}
+        self._pinned_until: Dict[str, float] = {}
+        self._draining_until: Dict[str, float] = {}
+        self._ready_seconds: Dict[str, float] = {}
+        self._stop_seconds: Dict[str, float] = {}
+
+        self.retry_base_delay = 5.0  # seconds
+        self.retry_max_delay = 300.0  # seconds
+        self.throughput_sample_interval = 10.0  # seconds
 
     def addBackend(self, backend: AIBackend, server: str, endpoint: str):
         self._backends[f"{server}:{endpoint}"] = backend
+        self._breakers[f"{server}:{endpoint}"] = CircuitBreaker(clock=self.clock)
+        self._residency[f"{server}:{endpoint}"] = Residency.COLD
+
+    def addCPUFallback(self, backend: AIBackend, server: str, endpoint: str):
+        self._cpu_fallbacks[f"{server}:{endpoint}"] = f"{server}:{backend.endpoint.name}"
+        self.addBackend(backend, server, backend.endpoint.name)
+
+    def attachInstances(self):
+        # models that other clients loaded into an attached instance are resident too, so the first swap unloads them
+        attached = set()
+        for server_endpoint, backend in self._backends.items():
+            if backend.attached_instance is None or backend.runs_on_cpu or not backend.attachInstance():
+                continue
+
+            # endpoints sharing an instance unload it once
+            if backend.attached_instance not in attached:
+                attached.add(backend.attached_instance)
+                self._residency[server_endpoint] = Residency.HOT
+
+    def addReadyListener(self, listener: Callable[[str, AIBackend], None]):
+        self._ready_listeners.append(listener)
+
+    def getCircuitBreaker(self, server_endpoint: str) -> CircuitBreaker:
+        return self._breakers[server_endpoint]
+
+    def getResidency(self, server_endpoint: str) -> Residency:
+        return self._residency[server_endpoint]
+
+    def getUnavailability(self, server_endpoint: str) -> Tuple[str, float]:
+        draining_until = self._draining_until.get(server_endpoint)
+        if draining_until is not None:
+            return f"{self._backends[server_endpoint].service_name} is being drained.", max(0.0, draining_until - self.clock())
+
+        pinned = self._pinnedTenant(server_endpoint)
+        if pinned is not None:
+            return f"{self._backends[pinned].service_name} is pinned.", self.pinnedFor(pinned)
+
+        breaker = self._breakers[server_endpoint]
+        return breaker.last_error or "Backend could not be started", breaker.retryAfter()
+
+    def getLastUsed(self, server_endpoint: str) -> float|None:
+        return self._last_used.get(server_endpoint)
+
+    def getActive(self) -> str|None:
+        return self._active
+
+
+    def pin(self, server_endpoint: str, seconds: float):
+        self._checkEndpoint(server_endpoint)
+        self._pinned_until[server_endpoint] = self.clock() + seconds
+
+    def unpin(self, server_endpoint: str):
+        self._checkEndpoint(server_endpoint)
+        self._pinned_until.pop(server_endpoint, None)
+
+    def pinnedFor(self, server_endpoint: str) -> float:
+        return max(0.0, self._pinned_until.get(server_endpoint, 0.0) - self.clock())
+
+    def _isPinned(self, server_endpoint: str) -> bool:
+        return self.pinnedFor(server_endpoint) > 0 and self._residency[server_endpoint] is Residency.HOT
+
+    def _pinnedTenant(self, server_endpoint: str) -> str|None:
+        # a pinned backend may only be replaced by one running next to it or sharing its service
+        successor = self._backends[server_endpoint]
+        if successor.runs_on_cpu:
+            return None
+
+        for pinned in self._pinned_until:
+            if pinned == server_endpoint or self._backends[pinned].runs_on_cpu or not self._isPinned(pinned):
+                continue
+
+            if self._backends[pinned].sharesServiceWith(successor):
+                continue
 
+            return pinned
 
-    def stopBackend(self, server_endpoint: str):
+        return None
+
+    def expectedSwapSeconds(self, server_endpoint: str) -> float|None:
+        self._checkEndpoint(server_endpoint)
+        if self._active == server_endpoint and self._residency[server_endpoint] is Residency.HOT:
+            return 0.0
+
+        if server_endpoint not in self._ready_seconds:
+            return None
+
+        # readying the backend, plus stopping every backend it would replace
+        seconds = self._ready_seconds[server_endpoint]
+        successor = self._backends[server_endpoint]
+        for other, backend in self._backends.items():
+            if other == server_endpoint or backend.runs_on_cpu or successor.runs_on_cpu or self._residency[other] is not Residency.HOT:
+                continue
+
+            if not backend.sharesServiceWith(successor):
+                seconds += self._stop_seconds.get(other, 0.0)
+
+        return seconds
+
+    def drain(self, server_endpoint: str, timeout: float) -> bool:
+        self._checkEndpoint(server_endpoint)
+        backend = self._backends[server_endpoint]
+
+        # new requests are turned away until the queued jobs are done and the model is unloaded
+        deadline = self.clock() + timeout
+        with self._lock:
+            self._draining_until[server_endpoint] = max(deadline, self._draining_until.get(server_endpoint, 0.0))
+
+        try:
+            self.unpin(server_endpoint)
+            idle = backend.waitForIdle(timeout)
+            self.stopBackend(server_endpoint)
+        finally:
+            # an overlapping drain that waits longer clears the entry itself
+            with self._lock:
+                if self._draining_until.get(server_endpoint) == deadline:
+                    self._draining_until.pop(server_endpoint)
+
+        return idle
+
+    def snapshotKVCache(self, server_endpoint: str) -> bool:
+        self._checkEndpoint(server_endpoint)
+        backend = self._backends[server_endpoint]
+
+        with self._lock:
+            if backend.kv_cache_save_path is None or self._residency[server_endpoint] is not Residency.HOT:
+                return False
+
+            return backend.saveKVCache()
+
+    def _checkEndpoint(self, server_endpoint: str):
+        if server_endpoint not in self._backends:
+            raise ValueError(f"Backend for server:endpoint '{server_endpoint}' not found.")
+
+
+    def stopBackend(self, server_endpoint: str, force: bool = False):
         if server_endpoint in self._backends:
-            backend = self._backends[server_endpoint]
-            backend.stopService()
+            with self._lock:
+                self._stop(server_endpoint, force)
+
+    def getBackends(self) -> Dict[str, AIBackend]:
+        return dict(self._backends)
 
-    def getBackend(self, server_endpoint: str) -> AIBackend|Literal[False]:
+    def getBackend(self, server_endpoint: str, estimate: RequestEstimate|None = None) -> AIBackend|Literal[False]:
         if server_endpoint in self._backends:
-            self.stopAllBackends(exclude=[server_endpoint])
             model = self._backends[server_endpoint]
-            if model.readyService():
+
+            if server_endpoint in self._draining_until:
+                return False
+
+            if estimate is not None and self._shouldUseCPU(server_endpoint, estimate):
+                return self._getCPUBackend(self._cpu_fallbacks[server_endpoint])
+
+            # steady state: the backend is already resident, so there is nothing to do
+            if (self._active == server_endpoint
+                    and self._residency[server_endpoint] is Residency.HOT
+                    and (model.isAttached() or model.isRunning())):
+                self._last_used[server_endpoint] = self.clock()
                 return model
-            else:
+
+            # a backend known to be broken fails fast instead of evicting the others again
+            if self._breakers[server_endpoint].isOpen():
                 return False
 
+            with self._lock:
+                if self._breakers[server_endpoint].isOpen() or self._pinnedTenant(server_endpoint) is not None:
+                    return False
+
+                self._last_used[server_endpoint] = self.clock()
+
+                busy = self._residentBackends(exclude=[server_endpoint], successor=model)
+                if len(busy) > 0 and self._residency[server_endpoint] is Residency.COLD:
+                    self._residency[server_endpoint] = Residency.STARTING
+
+            # the running jobs are waited for without the lock, so the resident backends keep answering meanwhile
+            self.waitForBusyBackends(busy)
+
+            with self._lock:
+                if self._breakers[server_endpoint].isOpen() or self._pinnedTenant(server_endpoint) is not None:
+                    if self._residency[server_endpoint] is Residency.STARTING:
+                        self._residency[server_endpoint] = Residency.COLD
+                    return False
+
+                # a swap requested while waiting is replaced by this one
+                self._active = server_endpoint
+
+                self.stopAllBackends(exclude=[server_endpoint], successor=model)
+                if self._readyBackend(server_endpoint):
+                    return model
+                else:
+                    return False
+
         raise ValueError(f"Backend for server:endpoint '{server_endpoint}' not found.")
 
-    def stopAllBackends(self, exclude: list[str] = []):
+    def _shouldUseCPU(self, server_endpoint: str, estimate: RequestEstimate) -> bool:
+        cpu_endpoint = self._cpu_fallbacks.get(server_endpoint)
+        if cpu_endpoint is None or self._breakers[cpu_endpoint].isOpen():
+            return False
+
+        # without another GPU tenant, running on the GPU costs nothing extra
+        tenant = self._active
+        if tenant is None or tenant == server_endpoint or self._residency[tenant] is not Residency.HOT:
+            return False
+
+        model = self._backends[server_endpoint]
+        tenant_backend = self._backends[tenant]
+        if tenant_backend.sharesServiceWith(model) or model.endpoint.priority > tenant_backend.endpoint.priority:
+            return False
+
+        config = model.endpoint.cpu_fallback
+        assert config is not None, "CPU fallback config cannot be None (MyPy...)"
+
+        seconds = expectedCPUSeconds(estimate, config, self._cpuThroughput(cpu_endpoint))
+
+        # a cold CPU instance has to load the model into RAM first, which may cost more than the swap it avoids
+        if self._residency[cpu_endpoint] is not Residency.HOT:
+            startup_seconds = self._ready_seconds.get(cpu_endpoint, config.startup_seconds)
+            swap_seconds = self.expectedSwapSeconds(server_endpoint)
+            if swap_seconds is not None and startup_seconds >= swap_seconds:
+                return False
+
+            seconds += startup_seconds
+
+        return seconds <= config.max_seconds
+
+    def _cpuThroughput(self, cpu_endpoint: str) -> float:
+        if cpu_endpoint in self._cpu_throughput:
+            return self._cpu_throughput[cpu_endpoint]
+
+        config = self._backends[cpu_endpoint].endpoint.cpu_fallback
+        assert config is not None, "CPU fallback config cannot be None (MyPy...)"
+        return config.tokens_per_second
+
+    def _sampleCPUThroughput(self, cpu_endpoint: str):
+        # measured next to the requests rather than in their path, as it takes an HTTP call
+        now = self.clock()
+        if now - self._throughput_sampled_at.get(cpu_endpoint, -self.throughput_sample_interval) < self.throughput_sample_interval:
+            return
+
+        self._throughput_sampled_at[cpu_endpoint] = now
+        backend = self._backends[cpu_endpoint]
+
+        def sample():
+            if not backend.isRunning():
+                return
+
+            measured = backend.measureThroughput()
+            if measured is not None and measured > 0:
+                self._cpu_throughput[cpu_endpoint] = measured
+
+        threading.Thread(target=sample, daemon=True).start()
+
+    def _getCPUBackend(self, cpu_endpoint: str) -> AIBackend|Literal[False]:
+        backend = self._backends[cpu_endpoint]
+        self._last_used[cpu_endpoint] = self.clock()
+
+        if self._residency[cpu_endpoint] is Residency.HOT and backend.isRunning():
+            self._sampleCPUThroughput(cpu_endpoint)
+            return backend
+
+        # the CPU profile runs next to the GPU tenant, so nothing gets stopped for it
+        with self._lock:
+            if self._readyBackend(cpu_endpoint):
+                self._sampleCPUThroughput(cpu_endpoint)
+                return backend
+
+            return False
+
+    def _readyBackend(self, server_endpoint: str) -> bool:
+        backend = self._backends[server_endpoint]
+        breaker = self._breakers[server_endpoint]
+
+        was_cold = self._residency[server_endpoint] is not Residency.HOT
+        started_at = self.clock()
+
+        self._residency[server_endpoint] = Residency.STARTING
+        try:
+            ready = backend.readyService()
+        except Exception as error:
+            # an unexpected error must not leave the backend starting forever
+            backend.last_error = f"{backend.service_name} failed to start: {error}"
+            print(backend.last_error)
+            ready = False
+
+        if ready:
+            self._residency[server_endpoint] = Residency.HOT
+
+            if was_cold:
+                self._ready_seconds[server_endpoint] = self.clock() - started_at
+
+            if breaker.failures > 0:
+                print(f"{backend.service_name} recovered.")
+            breaker.failures = 0
+            breaker.open_until = 0.0
+            breaker.last_error = None
+
+            for listener in self._ready_listeners:
+                listener(server_endpoint, backend)
+
+            return True
+
+        self._residency[server_endpoint] = Residency.COLD
+
+        breaker.failures += 1
+        breaker.last_error = backend.last_error
+        delay = min(self.retry_base_delay * 2 ** (breaker.failures - 1), self.retry_max_delay)
+        breaker.open_until = self.clock() + delay
+        print(f"{backend.service_name} failed {breaker.failures} time(s). Retrying in {delay:.0f} seconds.")
+
+        if self.background_retries:
+            retry = threading.Timer(delay, self._retryInBackground, args=(server_endpoint,))
+            retry.daemon = True
+            retry.start()
+
+        return False
+
+    def _retryInBackground(self, server_endpoint: str):
+        with self._lock:
+            # retrying a backend that is no longer wanted would only evict the one that is
+            if self._active != server_endpoint or self._breakers[server_endpoint].isOpen():
+                return
+
+            self._readyBackend(server_endpoint)
+
+    def _stop(self, server_endpoint: str, force: bool = False, successor: AIBackend|None = None):
+        backend = self._backends[server_endpoint]
+
+        started_at = self.clock()
+
+        self._residency[server_endpoint] = Residency.UNLOADING
+        backend.stopService(force=force, successor=successor)
+        self._stop_seconds[server_endpoint] = self.clock() - started_at
+
+        # an unload deferred until the backend's jobs are done keeps it in the unloading state
+        self._residency[server_endpoint] = Residency.UNLOADING if backend.pending_unload else Residency.COLD
+
+    def _isResident(self, server_endpoint: str) -> bool:
+        if self._residency[server_endpoint] is Residency.UNLOADING and not self._backends[server_endpoint].pending_unload:
+            self._residency[server_endpoint] = Residency.COLD
+
+        return self._residency[server_endpoint] is not Residency.COLD
+
+    def evictLeastRecentlyUsed(self) -> bool:
+        with self._lock:
+            active = self._backends.get(self._active) if self._active is not None else None
+
+            candidates = []
+            for server_endpoint, backend in self._backends.items():
+                if backend is active or not backend.isRunning() or self._isPinned(server_endpoint):
+                    continue
+
+                if active is not None and backend.sharesServiceWith(active):
+                    continue
+
+                candidates.append(server_endpoint)
+
+            if len(candidates) == 0:
+                return False
+
+            server_endpoint = min(candidates, key=lambda candidate: self._last_used.get(candidate, 0.0))
+            print(f"Evicting {self._backends[server_endpoint].service_name} to free memory.")
+            self._stop(server_endpoint, force=True)
+            return True
+
+    def _residentBackends(self, exclude: list[str] = [], successor: AIBackend|None = None) -> List[AIBackend]:
+        backends = []
+        for server_endpoint, backend in self._backends.items():
+            if server_endpoint in exclude or backend.runs_on_cpu or not self._isResident(server_endpoint):
+                continue
+
+            if successor is not None and backend.sharesServiceWith(successor):
+                continue
+
+            backends.append(backend)
+
+        return backends
+
+    def waitForBusyBackends(self, backends: List[AIBackend]):
+        if len(backends) == 0:
+            return
+
+        # let running jobs finish rather than evicting the model in the middle of them, for as long as the most patient backend allows
+        deadline = time.monotonic() + max(backend.eviction_wait for backend in backends)
+        for backend in backends:
+            if not backend.waitForIdle(max(0.0, deadline - time.monotonic())):
+                print(f"{backend.service_name} is still busy after waiting for its jobs.")
+
+    def stopAllBackends(self, exclude: list[str] = [], successor: AIBackend|None = None):
         for server_endpoint, backend in self._backends.items():
-            if server_endpoint not in exclude:
-                backend.stopService()
+            if server_endpoint in exclude or backend.runs_on_cpu or not self._isResident(server_endpoint):
+                continue
+
+            # the successor takes the shared service over by itself
+            if successor is not None and backend.sharesServiceWith(successor):
+                self._residency[server_endpoint] = Residency.COLD
+                continue
+
+            if self._residency[server_endpoint] is Residency.HOT:
+                self._stop(server_endpoint, successor=successor)
 
 _backend_manager = AIBackendManager()
 
@@ -37,6 +461,11 @@ def getBackendManager() -> AIBackendManager:
     global _backend_manager
     return _backend_manager
 
+# worker processes replace the manager with a proxy to the supervisor's
+def setBackendManager(manager: Any):
+    global _backend_manager
+    _backend_manager = manager
+
 
 backends: Dict[str, Type[AIBackend]] = {}
 
@@ -4,11 +4,16 @@ import urllib.error, urllib.request
 from typing import List
 
 from ..aibackend import AIBackend
+from ..config import AIBackendConfig, EndpointConfig, ServerConfig
 
 class ComfyUI(AIBackend):
     supports_attaching_to_running_instance = True
     supports_model_unloading               = True
 
+    def __init__(self, config: AIBackendConfig, server: ServerConfig, endpoint: EndpointConfig):
+        super().__init__(config, server, endpoint)
+
+        self.checkpoint_potentially_loaded = False
 
     def _modifyParameters(self, parameters: List = []) -> List:
             return parameters + ["--port", str(self.backend_port)]
@@ -39,7 +44,7 @@ class ComfyUI(AIBackend):
     def _testBackendAPI(self, force_attached: bool = False) -> bool:
         try:
             backend_url = self.attached_instance if force_attached else self.backendURL()
-            with urllib.request.urlopen(f'{backend_url}/system_stats') as response:
+            with urllib.request.urlopen(f'{backend_url}/system_stats', timeout=self.probe_timeout) as response:
                 if response.status == 200:
                     self.is_ready = True
                     self.checkpoint_potentially_loaded = True
@@ -47,12 +52,30 @@ class ComfyUI(AIBackend):
 
                 return False
 
-        except urllib.error.URLError as _:
+        except (urllib.error.URLError, TimeoutError) as _:
             return False
 
 
-    def unloadModel(self) -> bool:
-        if not self.isAttached() and self.isRunning():
+    def queueDepth(self) -> int:
+        if not self.checkpoint_potentially_loaded:
+            return 0
+
+        if not self.isAttached() and not self.isRunning():
+            return 0
+
+        try:
+            with urllib.request.urlopen(f'{self.backendURL()}/queue', timeout=self.probe_timeout) as response:
+                if response.status != 200:
+                    return 0
+
+                queue = json.loads(response.read().decode('utf-8'))
+                return len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+
+        except (urllib.error.URLError, TimeoutError, ValueError) as _:
+            return 0
+
+    def unloadModel(self, successor: AIBackend|None = None) -> bool:
+        if not self.isAttached() and not self.isRunning():
             return False
 
         if not self.checkpoint_potentially_loaded:
@@ -61,7 +84,7 @@ class ComfyUI(AIBackend):
         try:
             data = json.dumps({"unload_models": True}).encode('utf-8')
             request = urllib.request.Request(
-                f'http://{self.backendURL()}/free',
+                f'{self.backendURL()}/free',
                 method='POST',
                 data=data,
             )
@@ -1,63 +1,297 @@
 import argparse
+import hashlib
 import json
+import secrets
+import time
 import urllib.request, urllib.error
 
 from pathlib import Path
-from time import time
-from typing import List
+from typing import Dict, List
+
+from ..aibackend import AIBackend, SharedService
+from ..config import AIBackendConfig, EndpointConfig, ServerConfig, getConfig
+
+# koboldcpp's admin API accepts this in place of a config file name to drop the model
+UNLOAD_CONFIG = 'unload_model'
+
+
+# state of the koboldcpp process shared by the endpoints of one backend
+class _KoboldcppProcess(SharedService):
+    def __init__(self):
+        super().__init__()
+        self.loaded_config: str|None = None
+        self.admin_password = secrets.token_hex(16)
+
+_shared_processes: Dict[str, _KoboldcppProcess] = {}
 
-from ..aibackend import AIBackend
-from ..config import getConfig
 
 class Koboldcpp(AIBackend):
     supports_executing_directly = True
+    supports_model_unloading    = True
 
-    def _modifyParameters(self, parameters: List) -> List:
+    def __init__(self, config: AIBackendConfig, server: ServerConfig, endpoint: EndpointConfig):
+        super().__init__(config, server, endpoint)
 
-        parser = argparse.ArgumentParser()
-        parser.add_argument("--config", type=str)
-        parser.add_argument("--port", type=int)
-        parser.add_argument("--launch", action='store_true')
-        parser.add_argument("--showgui", action='store_true')
+        self.config_path = self._parseArguments(self.service_parameters)[0].config
+        if self.config_path is not None:
+            self.config_path = Path(self.config_path)
 
-        arguments, rest = parser.parse_known_args(parameters)
+        self.config_dir = getConfig().temp_dir / 'koboldcpp'
+        self.config_file_name: str|None = None
 
-        # --config overrides all other parameters
-        if arguments.config is not None:
-            config_path = Path(arguments.config)
+        # only endpoints defined by a .kcpps file can be switched to through the admin API
+        self.admin_switching = self.model_unloading and self.config_path is not None
 
-            if not config_path.is_file():
-                raise FileNotFoundError(f"koboldcpp config file '{arguments.config}' does not exist.")
+        self.shared = _shared_processes.setdefault(f"{self.type}{' (CPU)' if self.runs_on_cpu else ''}", _KoboldcppProcess())
+        self.shared.members.append(self)
 
-            with open(config_path, 'r') as file:
-                config_data = json.load(file)
+    def sharesServiceWith(self, other: AIBackend) -> bool:
+        return (isinstance(other, Koboldcpp)
+                and self.admin_switching
+                and other.admin_switching
+                and other.shared is self.shared)
 
-                config_data['port'] = self.backend_port
-                config_data['port_param'] = self.backend_port
-                config_data['showgui'] = False
-                config_data['launch'] = False
+    def readyService(self) -> bool:
+        if not self.admin_switching:
+            return super().readyService()
 
-            temp_config_path = getConfig().temp_dir / f'{config_path.name}_{int(time())}.{config_path.suffix}'
-            with open(temp_config_path, 'w') as file:
-                json.dump(config_data, file)
+        if self.isRunning() and self.shared.loaded_config == self.config_file_name:
+            return True
 
-            return ["--config", str(temp_config_path)]
+        host = self.shared.owner
+        if host is not None and host.isRunning():
+            return self._switchFrom(host)
 
-        modified_parameters = rest + ["--port", str(self.backend_port)]
+        return super().readyService()
 
-        return modified_parameters
+    def unloadModel(self, successor: AIBackend|None = None) -> bool:
+        if not self.admin_switching:
+            self.shutdown()
+            return True
+
+        if not self.isRunning() or self.shared.loaded_config == UNLOAD_CONFIG:
+            return True
+
+        if self._reloadConfig(UNLOAD_CONFIG):
+            self.is_ready = False
+            print(f"{self.service_name} model unloaded.")
+            return True
+
+        print(f"{self.service_name} model could not be unloaded through the admin API.")
+        self.shutdown()
+        return True
 
     def isReady(self) -> bool:
         if super().isReady():
             return True
 
         try:
-            with urllib.request.urlopen(f'http://localhost:{self.backend_port}/api/v1/info/version') as response:
+            with urllib.request.urlopen(f'http://localhost:{self.backend_port}/api/v1/info/version', timeout=self.probe_timeout) as response:
                 if response.status == 200:
                     self.is_ready = True
                     return True
                 return False
 
         # we'll assume that the server is not ready if we can't connect to it
-        except urllib.error.URLError as _:
+        except (urllib.error.URLError, TimeoutError) as _:
             return False
+
+    def measureThroughput(self) -> float|None:
+        try:
+            with urllib.request.urlopen(f'http://localhost:{self.backend_port}/api/extra/perf', timeout=self.probe_timeout) as response:
+                performance = json.loads(response.read().decode('utf-8'))
+                if performance.get('last_eval', 0) > 0:
+                    return performance['last_token_count'] / performance['last_eval']
+
+        except (urllib.error.URLError, TimeoutError, ValueError, KeyError) as _:
+            pass
+
+        return None
+
+    def _parseArguments(self, parameters: List):
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--config", type=str)
+        parser.add_argument("--port", type=int)
+        parser.add_argument("--launch", action='store_true')
+        parser.add_argument("--showgui", action='store_true')
+
+        return parser.parse_known_args(parameters)
+
+    def _modifyParameters(self, parameters: List) -> List:
+        arguments, rest = self._parseArguments(parameters)
+
+        # the parameters next to --config are merged into the written configuration file
+        if arguments.config is not None:
+            return ["--config", str(self.config_dir / self._writeConfig())]
+
+        modified_parameters = rest + ["--port", str(self.backend_port)]
+
+        return modified_parameters
+
+    def _writeConfig(self) -> str:
+        assert self.config_path is not None, "Config path cannot be None (MyPy...)"
+
+        if not self.config_path.is_file():
+            raise FileNotFoundError(f"koboldcpp config file '{self.config_path}' does not exist.")
+
+        with open(self.config_path, 'r') as file:
+            config_data = json.load(file)
+
+        # only a CPU profile's parameters override the config's values, other endpoints keep using the config as it is
+        if self.runs_on_cpu:
+            _, overrides = self._parseArguments(self.service_parameters)
+            config_data.update(self._parseOverrides(overrides))
+
+        config_data['port'] = self.backend_port
+        config_data['port_param'] = self.backend_port
+        config_data['showgui'] = False
+        config_data['launch'] = False
+
+        if self.admin_switching:
+            config_data['admin'] = True
+            config_data['admindir'] = str(self.config_dir)
+            config_data['adminpassword'] = self.shared.admin_password
+
+        # identical configs map to the same file, so nothing piles up in the temp dir
+        content = json.dumps(config_data, sort_keys=True)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+        file_name = f'{self.config_path.stem}-{digest}.kcpps'
+
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        config_file = self.config_dir / file_name
+        if not config_file.exists():
+            with open(config_file, 'w') as file:
+                file.write(content)
+
+        self.config_file_name = file_name
+        self._collectGarbage()
+
+        return file_name
+
+    def _parseOverrides(self, parameters: List) -> Dict:
+        overrides: Dict = {}
+        key = None
+        for parameter in parameters:
+            if parameter.startswith('--'):
+                key = parameter[2:].replace('-', '_')
+                overrides[key] = True
+                continue
+
+            if key is None:
+                continue
+
+            for convert in (int, float, str):
+                try:
+                    value = convert(parameter)
+                    break
+                except ValueError as _:
+                    continue
+
+            if overrides[key] is True:
+                overrides[key] = value
+            elif isinstance(overrides[key], list):
+                overrides[key].append(value)
+            else:
+                overrides[key] = [overrides[key], value]
+
+        return overrides
+
+    def _collectGarbage(self):
+        in_use = set()
+        for shared in _shared_processes.values():
+            for member in shared.members:
+                assert isinstance(member, Koboldcpp)
+                if member.config_file_name is not None:
+                    in_use.add(member.config_file_name)
+
+        for config_file in self.config_dir.glob('*.kcpps'):
+            if config_file.name not in in_use:
+                config_file.unlink(missing_ok=True)
+
+    def _switchFrom(self, host: 'Koboldcpp') -> bool:
+        elapsed_time_reference = time.monotonic()
+
+        self._takeOverService(self.shared)
+        self.is_ready = False
+
+        print(f"Switching {self.service_name} in place...")
+
+        if not self._reloadConfig(self._writeConfig()):
+            print(f"{self.service_name} could not be switched through the admin API. Restarting.")
+            self.shutdown()
+            return self.startService()
+
+        if not self._waitForReload():
+            print(f"{self.service_name} did not come back after switching. Restarting.")
+            self.shutdown()
+            return self.startService()
+
+        elapsed_time = time.monotonic() - elapsed_time_reference
+        print(f"{self.service_name} switched in {elapsed_time:.2f} seconds.")
+        return True
+
+    def _reloadConfig(self, file_name: str) -> bool:
+        try:
+            request = urllib.request.Request(
+                f'{self.backendURL()}/api/admin/reload_config',
+                method='POST',
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Bearer {self.shared.admin_password}',
+                },
+                data=json.dumps({'filename': file_name}).encode('utf-8')
+            )
+            with urllib.request.urlopen(request) as response:
+                if response.status != 200:
+                    return False
+
+                if not json.loads(response.read().decode('utf-8')).get('success', True):
+                    return False
+
+        except (urllib.error.URLError, ValueError) as _:
+            return False
+
+        self.shared.loaded_config = file_name
+        return True
+
+    def _waitForReload(self) -> bool:
+        # the old server keeps answering for a moment before koboldcpp restarts it, only one that went down has reloaded
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            if not self.isRunning() or time.monotonic() >= deadline:
+                return False
+
+            try:
+                with urllib.request.urlopen(f'http://localhost:{self.backend_port}/api/v1/info/version', timeout=1):
+                    time.sleep(self.initial_startup_delay)
+            except (urllib.error.URLError, OSError) as _:
+                break
+
+        delay = self.startup_delay_multiplier
+        while self.isRunning():
+            if self.isReady():
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            time.sleep(min(delay, remaining))
+            delay *= self.startup_delay_multiplier
+
+        return False
+
+    def _postStartUp(self):
+        if not self.admin_switching:
+            return
+
+        if self.shared.owner is not None and self.shared.owner is not self:
+            self.shared.owner._releaseService()
+
+        self.shared.owner = self
+        self.shared.loaded_config = self.config_file_name
+
+    def _preShutdown(self):
+        if self.shared.owner is self:
+            self.shared.owner = None
+            self.shared.loaded_config = None
@@ -1,12 +1,46 @@
+import argparse
 import json
+import time
 import urllib.request, urllib.error
 
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
 
-from ..aibackend import AIBackend
+from ..aibackend import AIBackend, SharedService
 from ..config import AIBackendConfig, EndpointConfig
 
+
+def splitLoRAParameters(parameters: List) -> Tuple[List, Dict[str, float]]:
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--lora", action='append', default=[])
+    parser.add_argument("--lora-scaled", nargs=2, action='append', default=[])
+    parser.add_argument("--lora-init-without-apply", action='store_true')
+
+    arguments, base_parameters = parser.parse_known_args(parameters)
+
+    lora_scales = {path: 1.0 for path in arguments.lora}
+    for path, scale in arguments.lora_scaled:
+        lora_scales[path] = float(scale)
+
+    return base_parameters, lora_scales
+
+
+# endpoints with identical base model parameters share one llama-server process,
+# which is started with the LoRA adapters of all of them
+class _LoRAGroup(SharedService):
+    def adapters(self) -> List[str]:
+        adapters = []
+        for member in self.members:
+            assert isinstance(member, LLaMACPP)
+            for path in member.lora_scales:
+                if path not in adapters:
+                    adapters.append(path)
+
+        return adapters
+
+_lora_groups: Dict[Tuple, _LoRAGroup] = {}
+
+
 class LLaMACPP(AIBackend):
     supports_executing_directly = True
     supports_kv_cache_restoring = True
@@ -14,6 +48,10 @@ class LLaMACPP(AIBackend):
     def __init__(self, config: AIBackendConfig, server: str, endpoint: EndpointConfig):
         super().__init__(config, server, endpoint)
 
+        base_parameters, self.lora_scales = splitLoRAParameters(self.service_parameters)
+        self.lora_group = _lora_groups.setdefault((self.type, *base_parameters), _LoRAGroup())
+        self.lora_group.members.append(self)
+
         if self.kv_cache_save_path is not None:
             # create the kv cache save path if it doesn't exist
             if not Path(self.kv_cache_save_path).exists():
@@ -23,30 +61,120 @@ class LLaMACPP(AIBackend):
 
         self.kv_cache_saved = False
 
-    def _modifyParameters(self, parameters: List) -> List:
-        modified_parameters = parameters + ["--port", str(self.backend_port)]
+    def sharesServiceWith(self, other: AIBackend) -> bool:
+        return isinstance(other, LLaMACPP) and other.lora_group is self.lora_group
+
+    def readyService(self) -> bool:
+        if self.isRunning():
+            return True
+
+        host = self.lora_group.owner
+        if host is not None and host is not self and host.isRunning():
+            return self._switchFrom(host)
+
+        return super().readyService()
+
+    def _switchFrom(self, host: AIBackend) -> bool:
+        elapsed_time_reference = time.monotonic()
+
+        if host.kv_cache_save_path is not None:
+            host.saveKVCache()
+
+        self._takeOverService(self.lora_group)
+        self.is_ready = True
+
+        if not self._applyLoRAScales():
+            print(f"{self.service_name} could not set the LoRA adapter scales. Restarting.")
+            self.shutdown()
+            return self.startService()
+
         if self.kv_cache_save_path is not None:
-            modified_parameters += ["--slot-save-path", str(self.kv_cache_save_path)]
+            self.restoreKVCache()
+
+        elapsed_time = time.monotonic() - elapsed_time_reference
+        print(f"{self.service_name} switched LoRA adapters in {elapsed_time:.2f} seconds.")
+        return True
+
+    def _applyLoRAScales(self) -> bool:
+        adapters = self.lora_group.adapters()
+        if len(adapters) == 0:
+            return True
+
+        scales = [{"id": id, "scale": self.lora_scales.get(path, 0.0)} for id, path in enumerate(adapters)]
+
+        try:
+            request = urllib.request.Request(
+                f'http://{self.host}:{self.backend_port}/lora-adapters',
+                method='POST',
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps(scales).encode('utf-8')
+            )
+            with urllib.request.urlopen(request) as response:
+                return response.status == 200
+
+        except urllib.error.URLError as _:
+            return False
+
+    def _modifyParameters(self, parameters: List) -> List:
+        modified_parameters, _ = splitLoRAParameters(parameters)
+
+        # all adapters of the group are loaded up front, the scales are set after start up
+        adapters = self.lora_group.adapters()
+        for path in adapters:
+            modified_parameters += ["--lora", path]
+        if len(adapters) > 0:
+            modified_parameters.append("--lora-init-without-apply")
+
+        modified_parameters += ["--port", str(self.backend_port)]
+        for member in self.lora_group.members:
+            if member.kv_cache_save_path is not None:
+                modified_parameters += ["--slot-save-path", str(member.kv_cache_save_path)]
+                break
 
         return modified_parameters
 
+    def _postStartUp(self):
+        host = self.lora_group.owner
+        if host is not None and host is not self:
+            host._releaseService()
+
+        self.lora_group.owner = self
+        self._applyLoRAScales()
+
+    def _preShutdown(self):
+        if self.lora_group.owner is self:
+            self.lora_group.owner = None
+
 
     def isReady(self) -> bool:
         if super().isReady():
             return True
 
         try:
-            with urllib.request.urlopen(f'http://localhost:{self.backend_port}/health') as response:
+            with urllib.request.urlopen(f'http://localhost:{self.backend_port}/health', timeout=self.probe_timeout) as response:
                 if response.status == 200:
                     self.is_ready = True
                     return True
                 return False
 
         # we'll assume that the server is not ready if we can't connect to it
-        except urllib.error.URLError as _:
+        except (urllib.error.URLError, TimeoutError) as _:
             return False
 
 
+    def measureThroughput(self) -> float|None:
+        # only available when llama-server is started with --metrics
+        try:
+            with urllib.request.urlopen(f'http://localhost:{self.backend_port}/metrics', timeout=self.probe_timeout) as response:
+                for line in response.read().decode('utf-8').splitlines():
+                    if line.startswith('llamacpp:predicted_tokens_seconds'):
+                        return float(line.split()[-1])
+
+        except (urllib.error.URLError, TimeoutError, ValueError) as _:
+            pass
+
+        return None
+
     def saveKVCache(self) -> bool:
         if not self.isRunning():
             return False
@@ -1,23 +1,47 @@
 import json
 import urllib.error, urllib.request
 
+import threading
+
 from os import environ
-from typing import Dict, List
+from typing import Callable, Dict, List
 
 from ..aibackend import AIBackend
+from ..config import AIBackendConfig, EndpointConfig, ServerConfig
+
+def _mapInThreads(function: Callable[[str], bool], items: List[str]) -> List[bool]:
+    # plain threads, as concurrent.futures refuses new work once the main thread has returned
+    results = [False] * len(items)
+
+    def run(index: int):
+        results[index] = function(items[index])
+
+    threads = [threading.Thread(target=run, args=(index,), daemon=True) for index in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
 
 class Ollama(AIBackend):
     supports_executing_directly            = True
     supports_attaching_to_running_instance = True
     supports_model_unloading               = True
 
+    def __init__(self, config: AIBackendConfig, server: ServerConfig, endpoint: EndpointConfig):
+        super().__init__(config, server, endpoint)
+
+        self.checkpoint_potentially_loaded = False
+        self.models_preloaded = False
 
     def attachInstance(self) -> bool:
         if self.attached_instance is None:
             raise RuntimeError(f"{self.service_name} is not configured to attach to a running instance.")
 
         if self._testBackendAPI(True):
-            self.is_attached = True
+            self._is_attached = True
             self.checkpoint_potentially_loaded = True
             print(f"Attached to {self.attached_instance}.")
             return True
@@ -25,6 +49,18 @@ class Ollama(AIBackend):
         print(f"Failed to attach to {self.attached_instance}. The backend API is not responding.")
         return False
 
+    def readyService(self) -> bool:
+        if not self.isAttached() and not self.isRunning():
+            self.models_preloaded = False
+
+        if not super().readyService():
+            return False
+
+        if len(self.endpoint.models) > 0 and not self.models_preloaded:
+            self.preloadModels()
+
+        return True
+
     def isReady(self) -> bool:
         self.checkpoint_potentially_loaded = True
         if super().isReady():
@@ -45,7 +81,7 @@ class Ollama(AIBackend):
 
     def _testBackendAPI(self, force_attached_instance: bool = False) -> bool:
         try:
-            with urllib.request.urlopen(f'{self._apiBaseURL(force_attached_instance)}/version') as response:
+            with urllib.request.urlopen(f'{self._apiBaseURL(force_attached_instance)}/version', timeout=self.probe_timeout) as response:
                 if response.status == 200:
                     self.is_ready = True
                     self.checkpoint_potentially_loaded = True
@@ -53,11 +89,50 @@ class Ollama(AIBackend):
 
                 return False
 
-        except urllib.error.URLError as _:
+        except (urllib.error.URLError, TimeoutError) as _:
             return False
 
 
-    def unloadModel(self) -> bool:
+    def preloadModels(self) -> bool:
+        results = _mapInThreads(self._preloadModel, self.endpoint.models)
+
+        self.models_preloaded = all(results)
+        self.checkpoint_potentially_loaded = True
+        return self.models_preloaded
+
+    def _preloadModel(self, model_name: str) -> bool:
+        # an empty request loads the model, embedding models only accept it through /embed
+        for api, data in (('generate', {}), ('embed', {'input': []})):
+            if self._postModelRequest(api, {'model': model_name, 'keep_alive': self.endpoint.keep_alive, **data}):
+                print(f"{self.service_name} model {model_name} preloaded.")
+                return True
+
+        print(f"Failed to preload model {model_name}.")
+        return False
+
+    def _unloadModel(self, model_name: str) -> bool:
+        if self._postModelRequest('generate', {'model': model_name, 'keep_alive': 0}):
+            return True
+
+        print(f"Failed to unload model {model_name}.")
+        return False
+
+    def _postModelRequest(self, api: str, data: Dict) -> bool:
+        request = urllib.request.Request(
+            f'{self._apiBaseURL()}/{api}',
+            method='POST',
+            headers={'Content-Type': 'application/json'},
+            data=json.dumps(data).encode('utf-8')
+        )
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status == 200
+
+        except urllib.error.URLError as _:
+            return False
+
+    def unloadModel(self, successor: AIBackend|None = None) -> bool:
         if not self.isAttached() and not self.isRunning():
             return False
 
@@ -65,36 +140,31 @@ class Ollama(AIBackend):
             return True
 
         try:
-            models = []
             with urllib.request.urlopen(f'{self._apiBaseURL()}/ps') as response:
                 if response.status != 200:
                     return False
 
-                models = json.loads(response.read().decode('utf-8'))['models']
+                loaded_models = [model['name'] for model in json.loads(response.read().decode('utf-8'))['models']]
 
-            for model in models:
-                model_name = model['name']
+        except urllib.error.URLError as _:
+            return False
 
-                request = urllib.request.Request(
-                    f'{self._apiBaseURL()}/generate',
-                    method='POST',
-                    headers={'Content-Type': 'application/json'},
-                    data=json.dumps({
-                        'model': model_name,
-                        'keep_alive': 0,
-                    }).encode('utf-8')
-                )
+        # endpoints that declare their models only evict those, leaving other residents alone
+        if len(self.endpoint.models) > 0:
+            declared_models = set(self.endpoint.models)
+            loaded_models = [name for name in loaded_models if name in declared_models or name.removesuffix(':latest') in declared_models]
 
-                with urllib.request.urlopen(request) as response:
-                    if response.status != 200:
-                        print(f"Failed to unload model {model_name}.")
-                        return False
+        # models the successor uses on the same instance stay loaded, it would only preload them again
+        if isinstance(successor, Ollama) and self.isAttached() and successor.attached_instance == self.attached_instance:
+            kept_models = set(successor.endpoint.models)
+            loaded_models = [name for name in loaded_models if name not in kept_models and name.removesuffix(':latest') not in kept_models]
 
-        except urllib.error.URLError as _:
-            return False
+        if len(loaded_models) > 0:
+            if not all(_mapInThreads(self._unloadModel, loaded_models)):
+                return False
 
-                      
         self.checkpoint_potentially_loaded = False
+        self.models_preloaded = False
         print(f"{self.service_name} models unloaded.")
         return True
 
@@ -1,14 +1,92 @@
+import json
 import urllib.error, urllib.request
 
-from typing import List
+from typing import Dict, List, Tuple
+
+from ..aibackend import AIBackend, SharedService
+from ..config import AIBackendConfig, EndpointConfig, ServerConfig
+
+
+# endpoints with the same launch parameters share one webui process and only switch checkpoints
+class _CheckpointGroup(SharedService):
+    def __init__(self):
+        super().__init__()
+        self.selected: Tuple[str|None, str|None]|None = None
+
+_checkpoint_groups: Dict[Tuple, _CheckpointGroup] = {}
 
-from ..aibackend import AIBackend
 
 class SDWebUI(AIBackend):
     supports_executing_directly            = True
     supports_attaching_to_running_instance = True
     supports_model_unloading               = True
 
+    def __init__(self, config: AIBackendConfig, server: ServerConfig, endpoint: EndpointConfig):
+        super().__init__(config, server, endpoint)
+
+        self.checkpoint_potentially_loaded = False
+
+        self.checkpoint_group = _checkpoint_groups.setdefault((self.type, self.attached_instance, *self.service_parameters), _CheckpointGroup())
+        self.checkpoint_group.members.append(self)
+
+    def sharesServiceWith(self, other: AIBackend) -> bool:
+        return isinstance(other, SDWebUI) and other.checkpoint_group is self.checkpoint_group
+
+    def readyService(self) -> bool:
+        host = self.checkpoint_group.owner
+        if host is not None and host is not self and (host.isAttached() or host.isRunning()):
+            assert isinstance(host, SDWebUI)
+
+            is_attached = host.isAttached()
+            self.checkpoint_potentially_loaded = host.checkpoint_potentially_loaded
+            self._takeOverService(self.checkpoint_group)
+            self._is_attached = is_attached
+            self.is_ready = True
+            self._cancelUnload()
+
+        elif not super().readyService():
+            return False
+
+        self.checkpoint_group.owner = self
+        return self._selectCheckpoint()
+
+    def _selectCheckpoint(self) -> bool:
+        selection = (self.endpoint.checkpoint, self.endpoint.vae)
+        if selection == (None, None) or self.checkpoint_group.selected == selection:
+            return True
+
+        options = {}
+        if self.endpoint.checkpoint is not None:
+            options['sd_model_checkpoint'] = self.endpoint.checkpoint
+        if self.endpoint.vae is not None:
+            options['sd_vae'] = self.endpoint.vae
+
+        try:
+            request = urllib.request.Request(
+                f'{self._apiBaseURL()}/options',
+                method='POST',
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps(options).encode('utf-8')
+            )
+            # webui loads the checkpoint before responding, from its RAM cache if it is there
+            with urllib.request.urlopen(request) as response:
+                if response.status != 200:
+                    print(f"{self.service_name} failed to select checkpoint {self.endpoint.checkpoint}.")
+                    return False
+
+        except urllib.error.URLError as _:
+            print(f"{self.service_name} failed to select checkpoint {self.endpoint.checkpoint}.")
+            return False
+
+        self.checkpoint_group.selected = selection
+        self.checkpoint_potentially_loaded = True
+        print(f"{self.service_name} switched to checkpoint {self.endpoint.checkpoint}.")
+        return True
+
+    def _preShutdown(self):
+        if self.checkpoint_group.owner is self:
+            self.checkpoint_group.owner = None
+            self.checkpoint_group.selected = None
 
     def _modifyParameters(self, parameters: List = []) -> List:
             return parameters + ["--port", str(self.backend_port), '--nowebui']
@@ -46,7 +124,7 @@ class SDWebUI(AIBackend):
 
     def _testBackendAPI(self, force_attached_instance: bool = False) -> bool:
         try:
-            with urllib.request.urlopen(f'{self._apiBaseURL(force_attached_instance)}/memory') as response:
+            with urllib.request.urlopen(f'{self._apiBaseURL(force_attached_instance)}/memory', timeout=self.probe_timeout) as response:
                 if response.status == 200:
                     self.is_ready = True
                     self.checkpoint_potentially_loaded = True
@@ -54,12 +132,34 @@ class SDWebUI(AIBackend):
 
                 return False
 
-        except urllib.error.URLError as _:
+        except (urllib.error.URLError, TimeoutError) as _:
             return False
 
 
-    def unloadModel(self) -> bool:
-        if not self.isAttached() and self.isRunning():
+    def queueDepth(self) -> int:
+        if not self.checkpoint_potentially_loaded:
+            return 0
+
+        if not self.isAttached() and not self.isRunning():
+            return 0
+
+        try:
+            with urllib.request.urlopen(f'{self._apiBaseURL()}/progress?skip_current_image=true', timeout=self.probe_timeout) as response:
+                if response.status != 200:
+                    return 0
+
+                state = json.loads(response.read().decode('utf-8')).get('state', {})
+                job_count = state.get('job_count', 0)
+                if job_count <= 0 and state.get('job', '') != '':
+                    return 1
+
+                return max(job_count, 0)
+
+        except (urllib.error.URLError, TimeoutError, ValueError) as _:
+            return 0
+
+    def unloadModel(self, successor: AIBackend|None = None) -> bool:
+        if not self.isAttached() and not self.isRunning():
             return False
 
         if not self.checkpoint_potentially_loaded:
@@ -67,7 +167,7 @@ class SDWebUI(AIBackend):
 
         try:
             request = urllib.request.Request(
-                f'http://{self._apiBaseURL()}/unload-checkpoint',
+                f'{self._apiBaseURL()}/unload-checkpoint',
                 method='POST'
             )
             with urllib.request.urlopen(request) as response:
@@ -1,9 +1,10 @@
+import copy
 import json
 
 from dataclasses import dataclass
 from pathlib import Path
 
-from typing import Dict, List
+from typing import Any, Dict, List
 
 @dataclass
 class AIBackendConfig:
@@ -13,13 +14,15 @@ class AIBackendConfig:
 
     default_parameters: List
     model_unloading: bool
+    eviction_wait: float
 
     def __init__(self,
                  type: str,
                  binary: str|Path|None = None,
                  attach_to: str|None = None,
                  default_parameters: List|None = None,
-                 model_unloading: bool = True):
+                 model_unloading: bool = True,
+                 eviction_wait: float = 120):
 
         from .aibackendmanager import getBackendClass
         backend_class = getBackendClass(type)
@@ -45,19 +48,85 @@ class AIBackendConfig:
         self.attached_instance = attach_to if backend_class.supports_attaching_to_running_instance else None
         self.default_parameters = default_parameters if default_parameters is not None else []
         self.model_unloading = backend_class.supports_model_unloading and model_unloading
+        self.eviction_wait = eviction_wait
+
+@dataclass
+class EmbeddingBatchingConfig:
+    max_batch_size: int = 64
+    max_wait_ms: float = 5
+
+@dataclass
+class CPUFallbackConfig:
+    parameters: List
+    max_seconds: float = 30
+    tokens_per_second: float = 10
+    prompt_tokens_per_second: float = 100
+    default_max_tokens: int = 256
+    startup_seconds: float = 20
+
+    def __init__(self,
+                 parameters: List|None = None,
+                 max_seconds: float = 30,
+                 tokens_per_second: float = 10,
+                 prompt_tokens_per_second: float = 100,
+                 default_max_tokens: int = 256,
+                 startup_seconds: float = 20):
+
+        self.parameters = parameters if parameters is not None else []
+        self.max_seconds = max_seconds
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.default_max_tokens = default_max_tokens
+        self.startup_seconds = startup_seconds
 
 @dataclass
 class EndpointConfig:
     name: str
     backend: str
     parameters: List
+    models: List[str]
+    cached_paths: List[str]
+    static_responses: Dict[str, Any]
 
     path_prefix: str = ""
     strip_prefix: bool = True
 
     kv_cache_saving: bool = True
 
-    def __init__(self, name: str, backend: str, path_prefix: str, strip_prefix: bool = False, parameters: List|None = None, kv_cache_saving: bool = True):
+    keep_alive: int|str = -1
+
+    checkpoint: str|None = None
+    vae: str|None = None
+
+    startup_timeout: float = 300
+
+    embedding_batching: EmbeddingBatchingConfig|None = None
+
+    priority: int = 0
+    cpu_fallback: CPUFallbackConfig|None = None
+    runs_on_cpu: bool = False
+
+    passthrough: bool = False
+
+    def __init__(self,
+                 name: str,
+                 backend: str,
+                 path_prefix: str,
+                 strip_prefix: bool = False,
+                 parameters: List|None = None,
+                 kv_cache_saving: bool = True,
+                 models: List[str]|None = None,
+                 keep_alive: int|str = -1,
+                 checkpoint: str|None = None,
+                 vae: str|None = None,
+                 startup_timeout: float = 300,
+                 cached_paths: List[str]|None = None,
+                 static_responses: Dict[str, Any]|None = None,
+                 embedding_batching: Dict|None = None,
+                 priority: int = 0,
+                 cpu_fallback: Dict|None = None,
+                 passthrough: bool = False):
+
         from .aibackendmanager import getBackendClass
 
         self.name = name
@@ -66,6 +135,29 @@ class EndpointConfig:
         self.strip_prefix = strip_prefix
         self.parameters = parameters if parameters is not None else []
         self.kv_cache_saving = kv_cache_saving if getBackendClass(backend).supports_kv_cache_restoring else False
+        self.models = models if models is not None else []
+        self.keep_alive = keep_alive
+        self.checkpoint = checkpoint
+        self.vae = vae
+        self.startup_timeout = startup_timeout
+        self.cached_paths = cached_paths if cached_paths is not None else []
+        self.static_responses = static_responses if static_responses is not None else {}
+        self.embedding_batching = EmbeddingBatchingConfig(**embedding_batching) if embedding_batching is not None else None
+        self.priority = priority
+        self.cpu_fallback = CPUFallbackConfig(**cpu_fallback) if cpu_fallback is not None else None
+        self.runs_on_cpu = False
+        self.passthrough = passthrough
+
+    def cpuProfile(self) -> 'EndpointConfig':
+        if self.cpu_fallback is None:
+            raise ValueError(f"Endpoint {self.name} has no CPU fallback profile.")
+
+        # the fallback parameters come last, so they override the GPU related ones
+        profile = copy.copy(self)
+        profile.name = f"{self.name} (CPU)"
+        profile.parameters = self.parameters + self.cpu_fallback.parameters
+        profile.runs_on_cpu = True
+        return profile
 
 
 @dataclass
@@ -75,10 +167,18 @@ class ServerConfig:
     port: int
     endpoints: List[EndpointConfig]
 
-    def __init__(self, name: str, host: str, port: int, endpoints: List[Dict]):
+    workers: int = 1
+    unix_socket: Path|None = None
+
+    gateway: bool = False
+
+    def __init__(self, name: str, host: str, port: int, endpoints: List[Dict], workers: int = 1, unix_socket: str|None = None, gateway: bool = False):
         self.name = name
         self.host = host
         self.port = port
+        self.workers = workers
+        self.unix_socket = Path(unix_socket) if unix_socket is not None else None
+        self.gateway = gateway
 
         self.endpoints = []
 
@@ -89,7 +189,18 @@ class ServerConfig:
                 path_prefix=endpoint_config.get('path_prefix', ''),
                 strip_prefix=endpoint_config.get('strip_prefix', False),
                 parameters=endpoint_config.get('parameters', []),
-                kv_cache_saving=endpoint_config.get('kv_cache_saving', True)
+                kv_cache_saving=endpoint_config.get('kv_cache_saving', True),
+                models=endpoint_config.get('models', []),
+                keep_alive=endpoint_config.get('keep_alive', -1),
+                checkpoint=endpoint_config.get('checkpoint', None),
+                vae=endpoint_config.get('vae', None),
+                startup_timeout=endpoint_config.get('startup_timeout', 300),
+                cached_paths=endpoint_config.get('cached_paths', []),
+                static_responses=endpoint_config.get('static_responses', {}),
+                embedding_batching=endpoint_config.get('embedding_batching', None),
+                priority=endpoint_config.get('priority', 0),
+                cpu_fallback=endpoint_config.get('cpu_fallback', None),
+                passthrough=endpoint_config.get('passthrough', False)
             )
             self.endpoints.append(endpoint)
 
@@ -98,12 +209,35 @@ class WarmupConfig:
     server: str
     endpoint: str
 
+@dataclass
+class MemoryMonitorConfig:
+    enabled: bool = True
+    min_available_mb: int = 2048
+    interval: float = 5  # seconds
+
+@dataclass
+class ResponseCacheConfig:
+    enabled: bool = True
+    max_entries: int = 1024
+    max_size_mb: int = 64
+    ttl: float = 3600  # seconds
+    request_timeout: float|None = 600  # seconds
+
+@dataclass
+class AdminConfig:
+    host: str
+    port: int
+    token: str
+
 @dataclass
 class Config:
     temp_dir: Path
     backends: Dict[str, AIBackendConfig]
     servers:  List[ServerConfig]
     warmup:   List[WarmupConfig]
+    memory_monitor: MemoryMonitorConfig
+    response_cache: ResponseCacheConfig
+    admin: AdminConfig|None
 
 
 config = None
@@ -163,11 +297,32 @@ def loadConfig(path: Path|None) -> Config:
         else:
             temp_dir = Path(temp_dir).absolute()
 
+        memory_monitor = MemoryMonitorConfig(**config_data.get('memory_monitor', {}))
+        response_cache = ResponseCacheConfig(**config_data.get('response_cache', {}))
+
+        admin = None
+        if 'admin' in config_data:
+            admin_data = config_data['admin']
+            if not admin_data.get('token'):
+                raise ValueError("The admin API requires a token.")
+
+            admin = AdminConfig(
+                host=admin_data.get('host', 'localhost'),
+                port=admin_data['port'],
+                token=admin_data['token']
+            )
+
+            if admin.port in server_ports:
+                raise ValueError(f"Duplicate server port: {admin.port}")
+
         config = Config(
             temp_dir=temp_dir,
             backends=backends,
             servers=servers_config,
-            warmup=warmup
+            warmup=warmup,
+            memory_monitor=memory_monitor,
+            response_cache=response_cache,
+            admin=admin
         )
 
     return config
@@ -0,0 +1,43 @@
+import json
+
+from dataclasses import dataclass
+
+from .config import CPUFallbackConfig
+
+@dataclass
+class RequestEstimate:
+    prompt_tokens: int
+    max_tokens: int|None
+
+
+def estimateRequest(body: bytes) -> RequestEstimate:
+    try:
+        request = json.loads(body.decode('utf-8'))
+    except ValueError as _:
+        request = None
+
+    if not isinstance(request, dict):
+        return RequestEstimate(len(body) // 4, None)
+
+    # the field names used by the OpenAI, llama.cpp, koboldcpp and ollama APIs respectively
+    max_tokens = None
+    for field in ('max_tokens', 'max_completion_tokens', 'n_predict', 'max_length'):
+        if isinstance(request.get(field), int) and request[field] >= 0:
+            max_tokens = request[field]
+            break
+
+    options = request.get('options')
+    if max_tokens is None and isinstance(options, dict) and isinstance(options.get('num_predict'), int):
+        max_tokens = options['num_predict'] if options['num_predict'] >= 0 else None
+
+    # roughly four bytes of text per token
+    prompt_tokens = 0
+    for field in ('prompt', 'messages', 'input', 'system'):
+        if field in request:
+            prompt_tokens += len(json.dumps(request[field])) // 4
+
+    return RequestEstimate(prompt_tokens, max_tokens)
+
+def expectedCPUSeconds(estimate: RequestEstimate, config: CPUFallbackConfig, tokens_per_second: float) -> float:
+    max_tokens = estimate.max_tokens if estimate.max_tokens is not None else config.default_max_tokens
+    return estimate.prompt_tokens / config.prompt_tokens_per_second + max_tokens / tokens_per_second
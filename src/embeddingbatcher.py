@@ -0,0 +1,177 @@
+import hashlib
+import json
+import threading
+
+from typing import Any, Callable, Dict, List, Tuple
+
+from .config import EmbeddingBatchingConfig
+
+# status, content type and body of an HTTP response
+Response = Tuple[int, str, bytes]
+
+EMBEDDING_PATHS = ('/v1/embeddings', '/embeddings', '/api/embed')
+
+
+def isEmbeddingPath(path: str) -> bool:
+    return path.partition('?')[0] in EMBEDDING_PATHS
+
+def _normalizeInput(value: Any) -> List:
+    if isinstance(value, str):
+        return [value]
+
+    # a single list of token ids is one input, not many
+    if isinstance(value, list) and len(value) > 0 and all(isinstance(item, int) for item in value):
+        return [value]
+
+    if isinstance(value, list):
+        return value
+
+    raise ValueError("Unsupported embedding input.")
+
+def _jsonResponse(data: Dict|List) -> Response:
+    return 200, 'application/json', json.dumps(data).encode('utf-8')
+
+
+class _Batch:
+    def __init__(self, template: Dict, headers: Dict[str, str]):
+        self.template = template
+        self.headers = headers
+        self.inputs: List = []
+        self.positions: Dict[str, int] = {}
+        self.submitted = 0
+        self.closed = False
+        self.done = threading.Event()
+
+        self.embeddings: List = []
+        self.upstream: Dict = {}
+        self.bare_list = False
+        self.error: Response|None = None
+
+    def add(self, inputs: List) -> List[int]:
+        positions = []
+        for item in inputs:
+            # identical inputs are embedded only once
+            key = json.dumps(item)
+            if key not in self.positions:
+                self.positions[key] = len(self.inputs)
+                self.inputs.append(item)
+
+            positions.append(self.positions[key])
+
+        self.submitted += len(inputs)
+        return positions
+
+
+class EmbeddingBatcher:
+    def __init__(self, config: EmbeddingBatchingConfig, send: Callable[[str, Dict, Dict[str, str]], Response]):
+        self.max_batch_size = config.max_batch_size
+        self.max_wait = config.max_wait_ms / 1000
+        self.send = send
+
+        self._open: Dict[str, _Batch] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, path: str, request: Any, headers: Dict[str, str] = {}) -> Response:
+        if not isinstance(request, dict):
+            raise ValueError("The embedding request must be a JSON object.")
+
+        inputs = _normalizeInput(request.get('input'))
+        template = {key: value for key, value in request.items() if key != 'input'}
+        # requests are only batched with those made with the same credentials, the first one's headers are sent for all
+        authorization = next((value for name, value in headers.items() if name.lower() == 'authorization'), '')
+        credentials = hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+        batch_key = f"{path} {credentials} {json.dumps(template, sort_keys=True)}"
+
+        with self._lock:
+            batch = self._open.get(batch_key)
+            if batch is None or len(batch.inputs) + len(inputs) > self.max_batch_size:
+                if batch is not None:
+                    self._close(batch_key, batch, path)
+
+                batch = _Batch(template, headers)
+                self._open[batch_key] = batch
+                timer = threading.Timer(self.max_wait, self._closeLocked, args=(batch_key, batch, path))
+                timer.daemon = True
+                timer.start()
+
+            positions = batch.add(inputs)
+
+            if len(batch.inputs) >= self.max_batch_size:
+                self._close(batch_key, batch, path)
+
+        batch.done.wait()
+
+        if batch.error is not None:
+            return batch.error
+
+        embeddings = [batch.embeddings[position] for position in positions]
+
+        if path.partition('?')[0] == '/api/embed':
+            return _jsonResponse({**batch.upstream, 'embeddings': embeddings})
+
+        if batch.bare_list:
+            return _jsonResponse([{'index': index, 'embedding': embedding} for index, embedding in enumerate(embeddings)])
+
+        # usage is shared out between the callers by their number of inputs
+        usage = batch.upstream.get('usage', {})
+        share = len(positions) / max(1, batch.submitted)
+        return _jsonResponse({
+            **batch.upstream,
+            'data': [{'object': 'embedding', 'index': index, 'embedding': embedding} for index, embedding in enumerate(embeddings)],
+            'usage': {key: round(value * share) for key, value in usage.items() if isinstance(value, int)},
+        })
+
+    def _closeLocked(self, batch_key: str, batch: _Batch, path: str):
+        with self._lock:
+            self._close(batch_key, batch, path)
+
+    def _close(self, batch_key: str, batch: _Batch, path: str):
+        if batch.closed:
+            return
+
+        batch.closed = True
+        if self._open.get(batch_key) is batch:
+            del self._open[batch_key]
+
+        threading.Thread(target=self._dispatch, args=(batch, path), daemon=True).start()
+
+    def _dispatch(self, batch: _Batch, path: str):
+        try:
+            status, content_type, body = self.send(path, {**batch.template, 'input': batch.inputs}, batch.headers)
+
+            if status != 200:
+                batch.error = (status, content_type, body)
+                return
+
+            upstream = json.loads(body.decode('utf-8'))
+            if path.partition('?')[0] == '/api/embed':
+                batch.upstream = upstream
+                batch.embeddings = batch.upstream.pop('embeddings')
+                return
+
+            # llama-server's own /embeddings answers with a bare list instead of the OpenAI object
+            if isinstance(upstream, list):
+                batch.bare_list = True
+                data = upstream
+            else:
+                batch.upstream = upstream
+                data = batch.upstream.pop('data')
+
+            batch.embeddings = [item['embedding'] for item in sorted(data, key=lambda item: item['index'])]
+
+        except Exception as error:
+            batch.error = (502, 'text/plain; charset=utf-8', f"Embedding request failed: {error}".encode('utf-8'))
+
+        finally:
+            batch.done.set()
+
+
+_batchers: Dict[str, EmbeddingBatcher] = {}
+_batchers_lock = threading.Lock()
+
+def getEmbeddingBatcher(server_endpoint: str, config: EmbeddingBatchingConfig, send: Callable[[str, Dict, Dict[str, str]], Response]) -> EmbeddingBatcher:
+    with _batchers_lock:
+        if server_endpoint not in _batchers:
+            _batchers[server_endpoint] = EmbeddingBatcher(config, send)
+
+        return _batchers[server_endpoint]
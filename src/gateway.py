@@ -0,0 +1,60 @@
+import json
+
+from typing import Dict, List
+
+from .config import EndpointConfig
+
+# the OpenAI API requests that name their model in the request body
+GATEWAY_PATHS = ('/v1/chat/completions', '/v1/completions', '/v1/embeddings')
+
+
+def isGatewayPath(path: str) -> bool:
+    return path.partition('?')[0] in GATEWAY_PATHS
+
+def endpointModels(endpoint: EndpointConfig) -> List[str]:
+    # endpoints that don't list their models are served under their own name
+    return endpoint.models if len(endpoint.models) > 0 else [endpoint.name]
+
+def requestedModel(body: bytes) -> str|None:
+    try:
+        request = json.loads(body.decode('utf-8'))
+    except ValueError as _:
+        return None
+
+    if not isinstance(request, dict) or not isinstance(request.get('model'), str):
+        return None
+
+    return request['model']
+
+def findEndpoint(endpoints: List[EndpointConfig], model: str) -> EndpointConfig|None:
+    for endpoint in endpoints:
+        if model in endpointModels(endpoint):
+            return endpoint
+
+    return None
+
+def _modelObject(model: str, endpoint: EndpointConfig) -> Dict:
+    return {'id': model, 'object': 'model', 'created': 0, 'owned_by': endpoint.backend}
+
+def modelCatalog(endpoints: List[EndpointConfig]) -> bytes:
+    models = []
+    listed = set()
+    for endpoint in endpoints:
+        for model in endpointModels(endpoint):
+            # a model served by several endpoints is routed to the first one
+            if model not in listed:
+                listed.add(model)
+                models.append(_modelObject(model, endpoint))
+
+    return json.dumps({'object': 'list', 'data': models}).encode('utf-8')
+
+def modelEntry(endpoints: List[EndpointConfig], model: str) -> bytes|None:
+    endpoint = findEndpoint(endpoints, model)
+    if endpoint is None:
+        return None
+
+    return json.dumps(_modelObject(model, endpoint)).encode('utf-8')
+
+def modelNotFound(model: str|None) -> bytes:
+    message = f"The model '{model}' does not exist." if model is not None else "The request does not name a model."
+    return json.dumps({'error': {'message': message, 'type': 'invalid_request_error', 'param': 'model', 'code': 'model_not_found'}}).encode('utf-8')
@@ -2,17 +2,23 @@ import threading
 
 from pathlib import Path
 
+from .admin import run_admin_server
 from .aibackendmanager import getBackendClass, getBackendManager
 from .config import loadConfig
-from .server import AIAPIHandler, run_server
+from .memorymonitor import isSupported as isMemoryMonitorSupported, startMemoryMonitor
+from .responsecache import initResponseCache
+from .server import AIAPIHandler, run_server, run_unix_server
+from .supervisor import Supervisor
 
 
 def serve(configuration_file: Path):
     config = loadConfig(configuration_file)
 
     ai_backend_manager = getBackendManager()
+    ai_backend_manager.addReadyListener(initResponseCache(config.response_cache).prefetch)
 
     handler_threads = []
+    supervisor = None
 
     for server_config in config.servers:
         for endpoint in server_config.endpoints:
@@ -23,8 +29,33 @@ def serve(configuration_file: Path):
 
             ai_backend_manager.addBackend(backend, server_config.name, endpoint.name)
 
-        handler_threads.append(threading.Thread(target=run_server, args=(AIAPIHandler, server_config)))
+            if endpoint.cpu_fallback is not None:
+                cpu_backend = backend_class(backend_config, server_config, endpoint.cpuProfile())
+                ai_backend_manager.addCPUFallback(cpu_backend, server_config.name, endpoint.name)
 
+        if server_config.workers > 1:
+            if supervisor is None:
+                supervisor = Supervisor(ai_backend_manager, config.temp_dir)
+                supervisor.start()
+
+            print(f"Starting {server_config.workers} worker processes for server \"{server_config.name}\"...")
+            supervisor.startWorkers(configuration_file, server_config.name, server_config.workers)
+        else:
+            handler_threads.append(threading.Thread(target=run_server, args=(AIAPIHandler, server_config)))
+
+        if server_config.unix_socket is not None:
+            handler_threads.append(threading.Thread(target=run_unix_server, args=(AIAPIHandler, server_config)))
+
+    ai_backend_manager.attachInstances()
+
+    if config.memory_monitor.enabled:
+        if isMemoryMonitorSupported():
+            startMemoryMonitor(ai_backend_manager, config.memory_monitor)
+        else:
+            print("Memory monitor is not supported on this platform.")
+
+    if config.admin is not None:
+        handler_threads.append(threading.Thread(target=run_admin_server, args=(config.admin,)))
 
     print(f"Starting {len(handler_threads)} server threads...")
     for thread in handler_threads:
@@ -0,0 +1,130 @@
+import threading
+import time
+
+from pathlib import Path
+from typing import Dict, List
+
+from .aibackendmanager import AIBackendManager
+from .config import MemoryMonitorConfig
+
+PROC_PATH = Path('/proc')
+
+
+def isSupported() -> bool:
+    return (PROC_PATH / 'meminfo').is_file()
+
+def readMemInfo() -> Dict[str, int]:
+    meminfo = {}
+    with open(PROC_PATH / 'meminfo', 'r') as file:
+        for line in file:
+            key, _, value = line.partition(':')
+            fields = value.split()
+            if len(fields) == 0:
+                continue
+
+            # values are reported in kB
+            meminfo[key] = int(fields[0]) * (1024 if len(fields) > 1 else 1)
+
+    return meminfo
+
+def availableMemory() -> int:
+    return readMemInfo().get('MemAvailable', 0)
+
+def _childPIDs(pid: int) -> List[int]:
+    children = []
+    try:
+        for task in (PROC_PATH / str(pid) / 'task').iterdir():
+            children += [int(child) for child in (task / 'children').read_text().split()]
+    except OSError as _:
+        pass
+
+    return children
+
+def _statusRSS(pid: int) -> int:
+    try:
+        with open(PROC_PATH / str(pid) / 'status', 'r') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError as _:
+        pass
+
+    return 0
+
+def processRSS(pid: int) -> int:
+    # launcher scripts such as webui.sh keep the actual backend in a child process
+    rss = 0
+    pending = [pid]
+    seen = set()
+    while len(pending) > 0:
+        current = pending.pop()
+        if current in seen:
+            continue
+
+        seen.add(current)
+        rss += _statusRSS(current)
+        pending += _childPIDs(current)
+
+    return rss
+
+
+class MemoryMonitor:
+    def __init__(self, manager: AIBackendManager, config: MemoryMonitorConfig):
+        self.manager = manager
+        self.min_available = config.min_available_mb * 1024 * 1024
+        self.interval = config.interval
+
+        self._thread: threading.Thread|None = None
+
+    def footprint(self) -> Dict[str, int]:
+        usage = {}
+        for server_endpoint, backend in self.manager.getBackends().items():
+            # read once, as the backend may be shut down concurrently
+            process = backend.service_process
+            if process is not None and process.poll() is None:
+                usage[server_endpoint] = processRSS(process.pid)
+
+        return usage
+
+    def check(self):
+        available = availableMemory()
+        while available < self.min_available:
+            print(f"Available memory is low ({available // 2**20} MiB), backend memory usage: "
+                  + ", ".join(f"{name}: {rss // 2**20} MiB" for name, rss in self.footprint().items()))
+
+            if not self.manager.evictLeastRecentlyUsed():
+                print("No inactive backend left to evict.")
+                return
+
+            available = availableMemory()
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def monitor():
+            while True:
+                try:
+                    self.check()
+                except Exception as error:
+                    print(f"Memory monitor check failed: {error}")
+
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=monitor, daemon=True)
+        self._thread.start()
+        print(f"Memory monitor started (minimum available memory {self.min_available // 2**20} MiB).")
+
+_memory_monitor: MemoryMonitor|None = None
+
+def startMemoryMonitor(manager: AIBackendManager, config: MemoryMonitorConfig) -> MemoryMonitor:
+    global _memory_monitor
+    if _memory_monitor is None:
+        _memory_monitor = MemoryMonitor(manager, config)
+        _memory_monitor.start()
+
+    return _memory_monitor
+
+def getMemoryMonitor() -> MemoryMonitor|None:
+    global _memory_monitor
+    return _memory_monitor
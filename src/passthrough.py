@@ -0,0 +1,106 @@
+import errno
+import os
+import socket
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Iterator, Tuple
+
+CHUNK_SIZE = 64 * 1024  # the default pipe capacity on Linux
+
+@dataclass
+class RelayStatistics:
+    bytes_to_backend: int = 0
+    bytes_to_client: int = 0
+    seconds: float = 0.0
+    zero_copy: bool = False
+
+
+def isZeroCopySupported() -> bool:
+    return hasattr(os, 'splice')
+
+def bufferedInput(connection: socket.socket, rfile) -> bytes:
+    # the request parser may have read past the head, those bytes are only in the reader's buffer
+    connection.setblocking(False)
+    try:
+        return rfile.read1(CHUNK_SIZE) or b''
+    except (BlockingIOError, InterruptedError) as _:
+        return b''
+    finally:
+        connection.setblocking(True)
+
+def _splice(source: socket.socket, destination: socket.socket) -> Iterator[int]:
+    # sockets can only be spliced through a pipe, the data stays in the kernel either way
+    read_end, write_end = os.pipe()
+    try:
+        while True:
+            received = os.splice(source.fileno(), write_end, CHUNK_SIZE, flags=os.SPLICE_F_MOVE | os.SPLICE_F_MORE)
+            if received == 0:
+                return
+
+            remaining = received
+            while remaining > 0:
+                remaining -= os.splice(read_end, destination.fileno(), remaining, flags=os.SPLICE_F_MOVE | os.SPLICE_F_MORE)
+
+            yield received
+    finally:
+        os.close(read_end)
+        os.close(write_end)
+
+def _copy(source: socket.socket, destination: socket.socket) -> Iterator[int]:
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+
+    while True:
+        received = source.recv_into(buffer)
+        if received == 0:
+            return
+
+        destination.sendall(view[:received])
+        yield received
+
+def _pump(source: socket.socket, destination: socket.socket, zero_copy: bool) -> Tuple[int, bool]:
+    total = 0
+    try:
+        try:
+            for received in (_splice if zero_copy else _copy)(source, destination):
+                total += received
+
+        except OSError as error:
+            # sockets the kernel can't splice are copied instead
+            if not zero_copy or total > 0 or error.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+
+            zero_copy = False
+            for received in _copy(source, destination):
+                total += received
+
+    except OSError as _:
+        pass
+
+    finally:
+        # pass the end of the stream on, the other direction may still be sending
+        try:
+            destination.shutdown(socket.SHUT_WR)
+        except OSError as _:
+            pass
+
+    return total, zero_copy
+
+def relay(client: socket.socket, backend: socket.socket) -> RelayStatistics:
+    zero_copy = isZeroCopySupported()
+    statistics = RelayStatistics(zero_copy=zero_copy)
+    started_at = time.monotonic()
+
+    def toClient():
+        statistics.bytes_to_client, _ = _pump(backend, client, zero_copy)
+
+    downstream = threading.Thread(target=toClient, daemon=True)
+    downstream.start()
+
+    statistics.bytes_to_backend, statistics.zero_copy = _pump(client, backend, zero_copy)
+    downstream.join()
+
+    statistics.seconds = time.monotonic() - started_at
+    return statistics
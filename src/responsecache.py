@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+import time
+import urllib.error, urllib.request
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List
+
+from .aibackend import AIBackend
+from .config import EndpointConfig, ResponseCacheConfig
+from .gateway import modelCatalog, modelEntry
+
+@dataclass
+class CachedResponse:
+    status: int
+    content_type: str
+    body: bytes
+    stored_at: float
+
+
+class ResponseCache:
+    def __init__(self, config: ResponseCacheConfig):
+        self.enabled = config.enabled
+        self.max_entries = config.max_entries
+        self.max_size = config.max_size_mb * 1024 * 1024
+        self.ttl = config.ttl
+        self.request_timeout = config.request_timeout
+
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(server_endpoint: str, method: str, path: str, body: bytes = b'', authorization: str = '') -> str:
+        # responses are only shared between clients with the same credentials
+        credentials = hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+        return f"{server_endpoint} {method} {path} {hashlib.sha256(body).hexdigest()} {credentials}"
+
+    def get(self, key: str) -> CachedResponse|None:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                return None
+
+            if time.monotonic() - response.stored_at > self.ttl:
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: CachedResponse):
+        if not self.enabled or len(response.body) > self.max_size:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = response
+            self._size += len(response.body)
+
+            while len(self._entries) > self.max_entries or self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        response = self._entries.pop(key)
+        self._size -= len(response.body)
+
+    def fetch(self, server_endpoint: str, backend_url: str, method: str, path: str, body: bytes = b'', headers: Dict[str, str] = {}) -> CachedResponse:
+        request = urllib.request.Request(
+            f'{backend_url}{path}',
+            method=method,
+            headers=headers,
+            data=body if method != 'GET' else None
+        )
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.request_timeout) as upstream:
+                response = CachedResponse(upstream.status, upstream.headers.get('Content-Type', 'application/octet-stream'), upstream.read(), time.monotonic())
+
+        # errors are passed on to the client, but never cached
+        except urllib.error.HTTPError as error:
+            return CachedResponse(error.code, error.headers.get('Content-Type', 'text/plain'), error.read(), time.monotonic())
+
+        if response.status == 200:
+            self.put(self.key(server_endpoint, method, path, body, headers.get('Authorization', '')), response)
+
+        return response
+
+    def prefetch(self, server_endpoint: str, backend: AIBackend):
+        if not self.enabled or len(backend.endpoint.cached_paths) == 0:
+            return
+
+        def refresh():
+            for path in backend.endpoint.cached_paths:
+                try:
+                    self.fetch(server_endpoint, backend.backendURL(), 'GET', path)
+                except (urllib.error.URLError, TimeoutError, RuntimeError) as _:
+                    pass
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+# headers that only concern the connection to AI Model Juggler, or that would change the encoding of the cached body
+_UNFORWARDED_HEADERS = {'accept-encoding', 'connection', 'content-length', 'host', 'keep-alive', 'proxy-authorization', 'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade'}
+
+def forwardedHeaders(headers) -> Dict[str, str]:
+    return {name: value for name, value in headers.items() if name.lower() not in _UNFORWARDED_HEADERS}
+
+def matchesPath(paths: List[str], path: str) -> bool:
+    return path.partition('?')[0] in paths
+
+def staticResponse(endpoint: EndpointConfig, path: str) -> bytes|None:
+    path = path.partition('?')[0]
+    if path in endpoint.static_responses:
+        return json.dumps(endpoint.static_responses[path]).encode('utf-8')
+
+    # the model list is built by the gateway's catalog builder, so both always agree
+    if len(endpoint.models) > 0:
+        if path == '/v1/models':
+            return modelCatalog([endpoint])
+
+        if path.startswith('/v1/models/'):
+            return modelEntry([endpoint], path[len('/v1/models/'):])
+
+    return None
+
+
+_response_cache: ResponseCache|None = None
+
+def initResponseCache(config: ResponseCacheConfig) -> ResponseCache:
+    global _response_cache
+    _response_cache = ResponseCache(config)
+    return _response_cache
+
+def getResponseCache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(ResponseCacheConfig())
+
+    return _response_cache
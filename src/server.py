@@ -1,10 +1,19 @@
 import http.server
+import json
+import math
+import socket
 import socketserver
+import urllib.error, urllib.parse, urllib.request
 
-from typing import Tuple
+from typing import Dict
 
 from .aibackendmanager import getBackendManager
-from .config import getConfig, ServerConfig
+from .config import EndpointConfig, ServerConfig
+from .cpufallback import estimateRequest, RequestEstimate
+from .embeddingbatcher import getEmbeddingBatcher, isEmbeddingPath, Response
+from .gateway import findEndpoint, isGatewayPath, modelCatalog, modelEntry, modelNotFound, requestedModel
+from .passthrough import bufferedInput, relay
+from .responsecache import forwardedHeaders, getResponseCache, matchesPath, staticResponse
 
 
 class AIAPIHandler(http.server.SimpleHTTPRequestHandler):
@@ -17,48 +26,232 @@ class AIAPIHandler(http.server.SimpleHTTPRequestHandler):
         if self.prepared:
             return
 
-        server_address: Tuple[str, int] = self.server.server_address
-        self.host = server_address[0]
-        self.port = server_address[1]
-
-        config = getConfig()
-
-        for server_config in config.servers:
-            if server_config.port == self.port:
-                self.server_name = server_config.name
-                self.endpoints = server_config.endpoints
-                break
+        server_config: ServerConfig = getattr(self.server, 'server_config')
+        self.host = server_config.host
+        self.port = server_config.port
+        self.server_name = server_config.name
+        self.endpoints = server_config.endpoints
+        self.gateway = server_config.gateway
 
     def handle_request(self):
         global ai_backend_manager
         self.prepare()
 
-        backend = None
+        endpoint = None
+        body = None
         path = self.path
-        for endpoint in self.endpoints:
-            if endpoint.path_prefix == '' or self.path.startswith(endpoint.path_prefix):
-                backend = getBackendManager().getBackend(f"{self.server_name}:{endpoint.name}")
 
-                if endpoint.strip_prefix:
-                    path = self.path[len(endpoint.path_prefix):]
-                break
+        if self.gateway and self.handle_catalog_request():
+            return
+
+        if self.gateway and self.command == 'POST' and isGatewayPath(self.path):
+            # the model named in the request picks the endpoint, its path prefix doesn't apply
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            model = requestedModel(body)
+            endpoint = findEndpoint(self.endpoints, model) if model is not None else None
 
-        if backend is None:
+            if endpoint is None:
+                self.send_body(404, 'application/json', modelNotFound(model))
+                print (f'{self.host}:{self.port}: no endpoint serves the model "{model}"')
+                return
+        else:
+            for candidate in self.endpoints:
+                if candidate.path_prefix == '' or self.path.startswith(candidate.path_prefix):
+                    endpoint = candidate
+
+                    if endpoint.strip_prefix:
+                        path = self.path[len(endpoint.path_prefix):]
+                    break
+
+        if endpoint is None:
             self.send_error(404, "Endpoint not found")
             print (f'{self.host}:{self.port}: endpoint not found for path "{self.path}"')
             return
 
-        if backend is False:
-            print (f'{self.host}:{self.port}: backend for "{endpoint.name}" could not be started.')
-            self.send_error(503, "Backend not available", "Backend could not be started")
+        server_endpoint = f"{self.server_name}:{endpoint.name}"
+
+        # metadata that can be answered without waking the backend up
+        static_response = staticResponse(endpoint, path)
+        if static_response is not None:
+            self.send_body(200, 'application/json', static_response)
+            return
+
+        if self.command in ('GET', 'POST') and matchesPath(endpoint.cached_paths, path):
+            self.handle_cached_request(server_endpoint, path, body)
+            return
+
+        if self.command == 'POST' and endpoint.embedding_batching is not None and isEmbeddingPath(path):
+            self.handle_embedding_request(server_endpoint, endpoint, path, body)
+            return
+
+        # the request size decides whether the CPU fallback can serve it instead of swapping
+        estimate = None
+        if endpoint.cpu_fallback is not None and self.command == 'POST':
+            if body is None:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            estimate = estimateRequest(body)
+
+        backend_url = self.ready_backend_url(server_endpoint, estimate)
+
+        if backend_url is None:
+            self.send_backend_unavailable(server_endpoint)
             return
 
-        backend_url = backend.backendURL()
+        if endpoint.passthrough and urllib.parse.urlsplit(backend_url).scheme == 'http':
+            self.handle_passthrough(server_endpoint, backend_url, path, body)
+            return
 
         self.send_response(307)
         self.send_header('Location', f"{backend_url}{path}")
         self.end_headers()
 
+    def handle_passthrough(self, server_endpoint: str, backend_url: str, path: str, body: bytes|None):
+        url = urllib.parse.urlsplit(backend_url)
+
+        try:
+            upstream = socket.create_connection((url.hostname, url.port or 80), timeout=10)
+        except OSError as _:
+            self.send_error(502, "Bad gateway", "The backend did not accept the connection")
+            return
+
+        # the relay leaves the connection to the backend, it is not parsed again
+        self.close_connection = True
+
+        with upstream:
+            upstream.settimeout(None)
+
+            head = f"{self.command} {path or '/'} {self.request_version}\r\n"
+            for name, value in self.headers.items():
+                if name.lower() == 'host':
+                    value = url.netloc
+                head += f"{name}: {value}\r\n"
+
+            request = head.encode('latin-1') + b"\r\n" + (body or b'') + bufferedInput(self.connection, self.rfile)
+            upstream.sendall(request)
+
+            statistics = relay(self.connection, upstream)
+            statistics.bytes_to_backend += len(request)
+
+        print(f'{self.host}:{self.port}: passthrough to "{server_endpoint}" closed after {statistics.seconds:.1f} s, '
+              f'{statistics.bytes_to_backend} bytes sent, {statistics.bytes_to_client} bytes received'
+              f'{"" if statistics.zero_copy else " (buffered)"}.')
+
+    def handle_catalog_request(self) -> bool:
+        # the catalog comes from the configuration, so listing the models wakes no backend up
+        path = self.path.partition('?')[0]
+        if self.command not in ('GET', 'HEAD') or not (path == '/v1/models' or path.startswith('/v1/models/')):
+            return False
+
+        if path == '/v1/models':
+            self.send_body(200, 'application/json', modelCatalog(self.endpoints))
+            return True
+
+        model = urllib.parse.unquote(path[len('/v1/models/'):])
+        entry = modelEntry(self.endpoints, model)
+        if entry is None:
+            self.send_body(404, 'application/json', modelNotFound(model))
+        else:
+            self.send_body(200, 'application/json', entry)
+
+        return True
+
+    def handle_cached_request(self, server_endpoint: str, path: str, body: bytes|None = None):
+        if body is None:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        cache = getResponseCache()
+        headers = forwardedHeaders(self.headers)
+        response = cache.get(cache.key(server_endpoint, self.command, path, body, headers.get('Authorization', '')))
+
+        if response is None:
+            backend_url = self.ready_backend_url(server_endpoint)
+            if backend_url is None:
+                self.send_backend_unavailable(server_endpoint)
+                return
+
+            try:
+                response = cache.fetch(server_endpoint, backend_url, self.command, path, body, headers)
+            except (urllib.error.URLError, TimeoutError) as _:
+                self.send_error(502, "Bad gateway", "The backend did not respond")
+                return
+
+        self.send_body(response.status, response.content_type, response.body)
+
+    def handle_embedding_request(self, server_endpoint: str, endpoint: EndpointConfig, path: str, body: bytes|None = None):
+        if body is None:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        def send(path: str, request: Dict, headers: Dict[str, str]) -> Response:
+            backend_url = self.ready_backend_url(server_endpoint)
+            if backend_url is None:
+                message, _ = getBackendManager().getUnavailability(server_endpoint)
+                return 503, 'text/plain; charset=utf-8', message.encode('utf-8')
+
+            upstream_request = urllib.request.Request(
+                f'{backend_url}{path}',
+                method='POST',
+                headers={**headers, 'Content-Type': 'application/json'},
+                data=json.dumps(request).encode('utf-8')
+            )
+            try:
+                with urllib.request.urlopen(upstream_request) as response:
+                    return response.status, response.headers.get('Content-Type', 'application/json'), response.read()
+
+            except urllib.error.HTTPError as error:
+                return error.code, error.headers.get('Content-Type', 'text/plain'), error.read()
+
+        assert endpoint.embedding_batching is not None, "Embedding batching config cannot be None (MyPy...)"
+        batcher = getEmbeddingBatcher(server_endpoint, endpoint.embedding_batching, send)
+
+        try:
+            status, content_type, response_body = batcher.submit(path, json.loads(body.decode('utf-8')), forwardedHeaders(self.headers))
+        except ValueError as _:
+            self.send_error(400, "Bad request", "Invalid embedding request")
+            return
+
+        self.send_body(status, content_type, response_body)
+
+    def ready_backend_url(self, server_endpoint: str, estimate: RequestEstimate|None = None) -> str|None:
+        # a concurrent swap can stop the backend between its lock-free check and reading the URL, asking again readies it under the lock
+        for _ in range(2):
+            backend = getBackendManager().getBackend(server_endpoint, estimate)
+            if backend is False:
+                return None
+
+            try:
+                return backend.backendURL()
+            except RuntimeError as _:
+                continue
+
+        return None
+
+    def send_body(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_backend_unavailable(self, server_endpoint: str):
+        print (f'{self.host}:{self.port}: backend for "{server_endpoint}" could not be started.')
+        message, retry_after = getBackendManager().getUnavailability(server_endpoint)
+        self.send_unavailable(message, retry_after)
+
+    def send_unavailable(self, message: str, retry_after: float):
+        body = f"Backend not available\n\n{message}\n".encode('utf-8', 'replace')
+
+        self.send_response(503, "Backend not available")
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Retry-After', str(max(1, math.ceil(retry_after))))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
     def do_GET(self):
         self.handle_request()
 
@@ -71,8 +264,37 @@ class AIAPIHandler(http.server.SimpleHTTPRequestHandler):
     def do_OPTIONS(self):
         self.handle_request()
 
-def run_server(handler_class, config: ServerConfig):
-    with socketserver.ThreadingTCPServer((config.host, config.port), handler_class) as httpd:
+    def address_string(self) -> str:
+        # Unix domain socket clients have no address
+        if isinstance(self.client_address, str) or len(self.client_address) == 0:
+            return 'unix'
+
+        return super().address_string()
+
+
+class ReusePortThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+    def server_bind(self):
+        # lets several worker processes listen on the same port, the kernel balances between them
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def run_server(handler_class, config: ServerConfig, reuse_port: bool = False):
+    server_class = ReusePortThreadingTCPServer if reuse_port else socketserver.ThreadingTCPServer
+
+    with server_class((config.host, config.port), handler_class) as httpd:
+        setattr(httpd, 'server_config', config)
         print(f"Server \"{config.name}\" running on {config.host}:{config.port}")
         httpd.serve_forever()
 
+def run_unix_server(handler_class, config: ServerConfig):
+    assert config.unix_socket is not None, "Unix socket path cannot be None (MyPy...)"
+
+    config.unix_socket.unlink(missing_ok=True)
+    with socketserver.ThreadingUnixStreamServer(str(config.unix_socket), handler_class) as httpd:
+        setattr(httpd, 'server_config', config)
+        print(f"Server \"{config.name}\" running on {config.unix_socket}")
+        httpd.serve_forever()
+
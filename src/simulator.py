@@ -0,0 +1,222 @@
+import csv
+import json
+import random
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Set
+
+from .aibackend import AIBackend
+from .aibackendmanager import AIBackendManager
+from .config import AIBackendConfig, EndpointConfig, loadConfig, ServerConfig
+
+@dataclass
+class TraceRequest:
+    timestamp: float
+    server_endpoint: str
+    duration: float|None
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += max(0.0, seconds)
+
+
+@dataclass
+class SimulationStatistics:
+    swaps: int = 0
+    startups: int = 0
+    reloads: int = 0
+    unloads: int = 0
+    shutdowns: int = 0
+    kv_saves: int = 0
+    kv_restores: int = 0
+    busy_time: float = 0.0
+    queueing_delays: List[float] = field(default_factory=list)
+    failed_requests: int = 0
+    unknown_endpoints: Set[str] = field(default_factory=set)
+
+
+# a cost is either a constant number of seconds or a normal distribution {"mean": ..., "stddev": ...}
+class CostModel:
+    def __init__(self, costs: Dict, seed: int|None = None):
+        self.default = costs.get('default', {})
+        self.endpoints = costs.get('endpoints', {})
+        self.random = random.Random(seed)
+
+    def sample(self, server_endpoint: str, name: str) -> float:
+        cost = self.endpoints.get(server_endpoint, {}).get(name, self.default.get(name, 0.0))
+
+        if isinstance(cost, dict):
+            return max(0.0, self.random.gauss(cost.get('mean', 0.0), cost.get('stddev', 0.0)))
+
+        return float(cost)
+
+
+class SimulatedBackend(AIBackend):
+    def __init__(self, config: AIBackendConfig, server: ServerConfig, endpoint: EndpointConfig, clock: SimulatedClock, costs: CostModel, statistics: SimulationStatistics):
+        super().__init__(config, server, endpoint)
+
+        self.server_endpoint = f"{server.name}:{endpoint.name}"
+        self.clock = clock
+        self.costs = costs
+        self.statistics = statistics
+
+        self.running = False
+        self.model_loaded = False
+        self.kv_cache_saved = False
+
+    def _spend(self, name: str):
+        seconds = self.costs.sample(self.server_endpoint, name)
+        self.clock.advance(seconds)
+        self.statistics.busy_time += seconds
+
+    def isRunning(self) -> bool:
+        return self.running
+
+    def isReady(self) -> bool:
+        return self.running
+
+    def readyService(self) -> bool:
+        if self.running and self.model_loaded:
+            return True
+
+        self.statistics.swaps += 1
+
+        if self.running:
+            self._spend('reload')
+            self.statistics.reloads += 1
+        else:
+            self._spend('startup')
+            self.statistics.startups += 1
+            self.running = True
+
+            if self.kv_cache_save_path is not None and self.kv_cache_saved:
+                self.restoreKVCache()
+
+        self.model_loaded = True
+        return True
+
+    def shutdown(self):
+        if not self.running:
+            return
+
+        self._spend('shutdown')
+        self.statistics.shutdowns += 1
+        self.running = False
+        self.model_loaded = False
+
+    def unloadModel(self, successor: AIBackend|None = None) -> bool:
+        if self.model_loaded:
+            self._spend('unload')
+            self.statistics.unloads += 1
+            self.model_loaded = False
+
+        return True
+
+    def saveKVCache(self) -> bool:
+        self._spend('kv_save')
+        self.statistics.kv_saves += 1
+        self.kv_cache_saved = True
+        return True
+
+    def restoreKVCache(self) -> bool:
+        self._spend('kv_restore')
+        self.statistics.kv_restores += 1
+        return True
+
+
+def loadTrace(path: Path) -> List[TraceRequest]:
+    requests = []
+
+    with open(path, 'r') as file:
+        if path.suffix == '.csv':
+            for row in csv.reader(file):
+                if len(row) < 2 or row[0].strip().startswith('#') or row[0].strip() == 'timestamp':
+                    continue
+
+                duration = float(row[2]) if len(row) > 2 and row[2].strip() != '' else None
+                requests.append(TraceRequest(float(row[0]), row[1].strip(), duration))
+        else:
+            for line in file:
+                if line.strip() == '':
+                    continue
+
+                entry = json.loads(line)
+                requests.append(TraceRequest(float(entry['timestamp']), entry['endpoint'], entry.get('duration')))
+
+    requests.sort(key=lambda request: request.timestamp)
+    return requests
+
+def percentile(values: List[float], fraction: float) -> float:
+    if len(values) == 0:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def simulate(config_path: Path, trace: List[TraceRequest], costs: CostModel) -> SimulationStatistics:
+    config = loadConfig(config_path)
+
+    clock = SimulatedClock()
+    statistics = SimulationStatistics()
+    manager = AIBackendManager(clock=clock, background_retries=False)
+
+    for server_config in config.servers:
+        for endpoint in server_config.endpoints:
+            backend = SimulatedBackend(config.backends[endpoint.backend], server_config, endpoint, clock, costs, statistics)
+            manager.addBackend(backend, server_config.name, endpoint.name)
+
+    for warmup_config in config.warmup:
+        manager.getBackend(f"{warmup_config.server}:{warmup_config.endpoint}")
+
+    # only the trace is reported, the backends keep counting into the same object
+    vars(statistics).update(vars(SimulationStatistics()))
+
+    # the swaps and the inference share one GPU, so requests are served one at a time in arrival order
+    # the trace starts once the warmup is done
+    first_timestamp = trace[0].timestamp if len(trace) > 0 else 0.0
+    offset = max(0.0, clock.now - first_timestamp)
+    start_time = first_timestamp + offset
+    clock.now = start_time
+
+    for request in trace:
+        arrival = request.timestamp + offset
+        clock.now = max(clock.now, arrival)
+
+        if request.server_endpoint not in manager.getBackends():
+            statistics.unknown_endpoints.add(request.server_endpoint)
+            statistics.failed_requests += 1
+            continue
+
+        if manager.getBackend(request.server_endpoint) is False:
+            statistics.failed_requests += 1
+            continue
+
+        statistics.queueing_delays.append(clock.now - arrival)
+
+        duration = request.duration if request.duration is not None else costs.sample(request.server_endpoint, 'inference')
+        clock.advance(duration)
+        statistics.busy_time += duration
+
+    total_time = clock.now - start_time
+    print(f"Simulated {len(trace)} requests over {total_time:.1f} seconds.")
+    print(f"Swaps: {statistics.swaps} (startups {statistics.startups}, reloads {statistics.reloads}), "
+          f"unloads: {statistics.unloads}, shutdowns: {statistics.shutdowns}, "
+          f"KV saves: {statistics.kv_saves}, KV restores: {statistics.kv_restores}")
+    print("Queueing delay: " + ", ".join(f"p{int(fraction * 100)} {percentile(statistics.queueing_delays, fraction):.2f} s" for fraction in (0.5, 0.9, 0.99)))
+    print(f"GPU idle time: {max(0.0, total_time - statistics.busy_time):.1f} seconds "
+          f"({100 * max(0.0, total_time - statistics.busy_time) / total_time if total_time > 0 else 0:.1f}%)")
+    if statistics.failed_requests > 0:
+        print(f"Failed requests: {statistics.failed_requests}")
+    if len(statistics.unknown_endpoints) > 0:
+        print("Unknown endpoints in the trace: " + ", ".join(sorted(statistics.unknown_endpoints)))
+
+    return statistics
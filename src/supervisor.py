@@ -0,0 +1,202 @@
+import os
+import secrets
+import socket
+import threading
+import time
+
+from multiprocessing import AuthenticationError, get_context
+from multiprocessing.connection import Client, Connection, Listener, wait
+from pathlib import Path
+from typing import Any, List, Literal, Tuple
+
+from .aibackendmanager import AIBackendManager, setBackendManager
+from .config import getConfig, loadConfig
+from .cpufallback import RequestEstimate
+
+# the supervisor process owns the backends, the worker processes only handle HTTP and ask it for them
+
+
+class RemoteBackend:
+    def __init__(self, service_name: str, backend_url: str, probe_timeout: float):
+        self.service_name = service_name
+        self.backend_url = backend_url
+        self.probe_timeout = probe_timeout
+
+    def backendURL(self) -> str:
+        return self.backend_url
+
+
+class RemoteBackendManager:
+    max_idle_connections = 8
+    unreachable_retry_after = 1.0  # seconds
+
+    def __init__(self, address: Any, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._idle_connections: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def _call(self, method: str, *args) -> Any:
+        # connections are not thread safe, so each call borrows one from the pool
+        with self._lock:
+            connection = self._idle_connections.pop() if len(self._idle_connections) > 0 else None
+
+        if connection is None:
+            connection = Client(self.address, authkey=self.authkey)
+
+        try:
+            connection.send((method, args))
+            status, result = connection.recv()
+        except (EOFError, OSError) as _:
+            connection.close()
+            raise
+
+        with self._lock:
+            if len(self._idle_connections) < self.max_idle_connections:
+                self._idle_connections.append(connection)
+                connection = None
+
+        if connection is not None:
+            connection.close()
+
+        if status == 'error':
+            raise ValueError(result)
+
+        return result
+
+    def getBackend(self, server_endpoint: str, estimate: RequestEstimate|None = None) -> RemoteBackend|Literal[False]:
+        # a supervisor that can't be asked leaves the backend unavailable, the handler answers 503
+        try:
+            result = self._call('getBackend', server_endpoint, estimate)
+        except (EOFError, OSError, ValueError, AuthenticationError) as error:
+            print(f"Asking the supervisor for {server_endpoint} failed: {error}")
+            return False
+
+        if result is None:
+            return False
+
+        return RemoteBackend(*result)
+
+    def getUnavailability(self, server_endpoint: str) -> Tuple[str, float]:
+        try:
+            message, retry_after = self._call('getUnavailability', server_endpoint)
+        except (EOFError, OSError, ValueError, AuthenticationError) as error:
+            return f"The backend supervisor did not answer: {error}", self.unreachable_retry_after
+
+        return message, retry_after
+
+
+class Supervisor:
+    worker_restart_delay = 1.0  # seconds
+
+    def __init__(self, manager: AIBackendManager, temp_dir: Path):
+        self.manager = manager
+        self.authkey = secrets.token_bytes(32)
+
+        if hasattr(socket, 'AF_UNIX'):
+            temp_dir.mkdir(parents=True, exist_ok=True)
+            address = temp_dir / f'supervisor-{os.getpid()}.sock'
+            address.unlink(missing_ok=True)
+            self.listener = Listener(str(address), family='AF_UNIX', authkey=self.authkey)
+        else:
+            self.listener = Listener(('127.0.0.1', 0), family='AF_INET', authkey=self.authkey)
+
+        self.address = self.listener.address
+
+    def start(self):
+        # not a daemon, so the process keeps running when all servers are handled by workers
+        threading.Thread(target=self._accept).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError) as _:
+                # a client with the wrong key must not stop the others from connecting
+                continue
+
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: Connection):
+        with connection:
+            while True:
+                try:
+                    method, args = connection.recv()
+                except (EOFError, OSError) as _:
+                    return
+
+                # the worker gets an answer whatever went wrong, instead of waiting for one forever
+                try:
+                    reply = ('ok', self._handle(method, args))
+                except Exception as error:
+                    reply = ('error', str(error))
+
+                try:
+                    connection.send(reply)
+                except (OSError, ValueError) as _:
+                    return
+
+    def _handle(self, method: str, args: Tuple) -> Any:
+        if method == 'getBackend':
+            # a concurrent swap can stop the backend before its URL is read, asking again readies it under the lock
+            for _ in range(2):
+                backend = self.manager.getBackend(*args)
+                if backend is False:
+                    return None
+
+                try:
+                    return backend.service_name, backend.backendURL(), backend.probe_timeout
+                except RuntimeError as _:
+                    continue
+
+            return None
+
+        if method == 'getUnavailability':
+            return self.manager.getUnavailability(*args)
+
+        raise ValueError(f"Unknown supervisor method '{method}'.")
+
+    def startWorkers(self, configuration_file: Path, server_name: str, count: int):
+        # spawned rather than forked, as the supervisor already runs threads
+        context = get_context('spawn')
+        args = (configuration_file, server_name, self.address, self.authkey)
+
+        workers = []
+        for _ in range(count):
+            worker = context.Process(target=runWorker, args=args, daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        threading.Thread(target=self._monitorWorkers, args=(context, args, workers), daemon=True).start()
+
+    def _monitorWorkers(self, context: Any, args: Tuple, workers: List[Any]):
+        server_name = args[1]
+        while True:
+            wait([worker.sentinel for worker in workers])
+
+            for index, worker in enumerate(workers):
+                if worker.exitcode is None:
+                    continue
+
+                print(f"Worker process {worker.pid} for server \"{server_name}\" exited with code {worker.exitcode}. Restarting it...")
+                # a worker that can't start at all is not restarted in a busy loop
+                time.sleep(self.worker_restart_delay)
+
+                workers[index] = context.Process(target=runWorker, args=args, daemon=True)
+                workers[index].start()
+
+
+def runWorker(configuration_file: Path, server_name: str, address: Any, authkey: bytes):
+    from .responsecache import initResponseCache
+    from .server import AIAPIHandler, run_server
+
+    config = loadConfig(configuration_file)
+    setBackendManager(RemoteBackendManager(address, authkey))
+    initResponseCache(config.response_cache)
+
+    for server_config in getConfig().servers:
+        if server_config.name == server_name:
+            run_server(AIAPIHandler, server_config, reuse_port=True)
+            return
+
+    raise ValueError(f"Server {server_name} not found in configuration")
@@ -3,9 +3,11 @@ from pathlib import Path
 
 from src.main import serve
 
-arg_parser = argparse.ArgumentParser(description="AI Model Juggler")
-arg_parser.add_argument("--config", "-c", type=str, default="config.json", help="Path to the configuration file")
-arguments = arg_parser.parse_args()
+# worker processes import this module again, so the program must only start when run directly
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="AI Model Juggler")
+    arg_parser.add_argument("--config", "-c", type=str, default="config.json", help="Path to the configuration file")
+    arguments = arg_parser.parse_args()
 
 
-serve(Path(arguments.config))
+    serve(Path(arguments.config))
@@ -0,0 +1,115 @@
+import http.client
+import json
+import socketserver
+import threading
+import unittest
+
+from src.admin import AdminAPIHandler, validateRequest
+from src.aibackendmanager import AIBackendManager, getBackendManager, setBackendManager
+from src.config import AdminConfig
+
+from .test_aibackendmanager import FakeBackend
+
+
+class QuietHandler(AdminAPIHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ValidateRequestTest(unittest.TestCase):
+    def assertInvalid(self, request, fields={}):
+        with self.assertRaises(ValueError):
+            validateRequest(request, fields)
+
+    def test_endpoint_is_required(self):
+        self.assertInvalid([])
+        self.assertInvalid({})
+        self.assertInvalid({'endpoint': 1})
+
+        validateRequest({'endpoint': 'server:a'}, {})
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertInvalid({'endpoint': 'server:a', 'seconds': 5})
+
+    def test_field_types(self):
+        validateRequest({'endpoint': 'server:a', 'seconds': 5}, {'seconds': float})
+        validateRequest({'endpoint': 'server:a', 'seconds': 2.5}, {'seconds': float})
+        validateRequest({'endpoint': 'server:a', 'force': True}, {'force': bool})
+
+        self.assertInvalid({'endpoint': 'server:a', 'seconds': '5'}, {'seconds': float})
+        self.assertInvalid({'endpoint': 'server:a', 'seconds': True}, {'seconds': float})
+        self.assertInvalid({'endpoint': 'server:a', 'seconds': float('inf')}, {'seconds': float})
+        self.assertInvalid({'endpoint': 'server:a', 'force': 1}, {'force': bool})
+
+
+class AdminAPITest(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeBackend('a')
+        self.manager = AIBackendManager(background_retries=False)
+        self.manager.addBackend(self.backend, 'server', 'a')
+
+        self.previous_manager = getBackendManager()
+        setBackendManager(self.manager)
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), QuietHandler)
+        self.server.daemon_threads = True
+        setattr(self.server, 'admin_config', AdminConfig('127.0.0.1', self.server.server_address[1], 'secret'))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        setBackendManager(self.previous_manager)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, path: str, body: bytes, token: str = 'secret') -> tuple:
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=10)
+        self.addCleanup(connection.close)
+        connection.request('POST', path, body=body, headers={'Authorization': f'Bearer {token}'})
+
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_token_is_required(self):
+        status, _ = self.post('/pin', b'{"endpoint": "server:a", "seconds": 60}', token='wrong')
+
+        self.assertEqual(status, 401)
+        self.assertEqual(self.manager.pinnedFor('server:a'), 0)
+
+    def test_pin(self):
+        status, response = self.post('/pin', b'{"endpoint": "server:a", "seconds": 60}')
+
+        self.assertEqual(status, 200)
+        self.assertGreater(response['pinned_for'], 59)
+
+    def test_invalid_bodies(self):
+        for body in (b'not json', b'[]', b'{"endpoint": ["server:a"]}', b'{"endpoint": "server:a", "seconds": -1}',
+                     b'{"endpoint": "server:a", "seconds": "60"}', b'{"endpoint": "server:a"}'):
+            with self.subTest(body=body):
+                status, response = self.post('/pin', body)
+                self.assertEqual(status, 400)
+                self.assertIn('error', response)
+
+    def test_invalid_pin_does_not_preload(self):
+        status, _ = self.post('/preload', b'{"endpoint": "server:a", "pin": 0}')
+
+        self.assertEqual(status, 400)
+        self.assertEqual(self.backend.starts, 0)
+
+    def test_preload_and_drain(self):
+        status, response = self.post('/preload', b'{"endpoint": "server:a", "pin": 60}')
+        self.assertEqual(status, 200)
+        self.assertEqual(response['residency'], 'hot')
+        self.assertGreater(response['pinned_for'], 59)
+
+        status, response = self.post('/drain', b'{"endpoint": "server:a", "timeout": 1}')
+        self.assertEqual(status, 200)
+        self.assertEqual(response, {'idle': True, 'residency': 'cold'})
+        self.assertEqual(self.manager.pinnedFor('server:a'), 0)
+
+    def test_unknown_endpoint_and_path(self):
+        self.assertEqual(self.post('/pin', b'{"endpoint": "server:b", "seconds": 60}')[0], 404)
+        self.assertEqual(self.post('/reload', b'{"endpoint": "server:a"}')[0], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import threading
+import unittest
+
+from src.aibackendmanager import AIBackendManager, CircuitBreaker, Residency
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBackend:
+    def __init__(self, name: str, ready: bool = True):
+        self.service_name = name
+        self.ready = ready
+        self.running = False
+        self.runs_on_cpu = False
+        self.attached_instance = None
+        self.eviction_wait = 0.0
+        self.pending_unload = False
+        self.last_error = None
+        self.starts = 0
+        self.stops = 0
+        self.idle = threading.Event()
+        self.idle.set()
+
+    def readyService(self) -> bool:
+        self.starts += 1
+        if isinstance(self.ready, Exception):
+            raise self.ready
+
+        if not self.ready:
+            self.last_error = f"{self.service_name} did not start."
+            return False
+
+        self.running = True
+        return True
+
+    def stopService(self, force: bool = False, successor=None):
+        self.stops += 1
+        self.running = False
+
+    def isRunning(self) -> bool:
+        return self.running
+
+    def isAttached(self) -> bool:
+        return False
+
+    def attachInstance(self) -> bool:
+        return False
+
+    def sharesServiceWith(self, other) -> bool:
+        return False
+
+    def waitForIdle(self, timeout: float) -> bool:
+        return self.idle.wait(timeout)
+
+    def backendURL(self) -> str:
+        if not self.running:
+            raise RuntimeError("Service is not running.")
+
+        return f"http://localhost/{self.service_name}"
+
+
+def makeManager(*backends: FakeBackend) -> tuple:
+    clock = FakeClock()
+    manager = AIBackendManager(clock=clock, background_retries=False)
+    for backend in backends:
+        manager.addBackend(backend, 'server', backend.service_name)
+
+    return manager, clock
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_open_until_the_deadline(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(open_until=clock.now + 5, clock=clock)
+
+        self.assertTrue(breaker.isOpen())
+        self.assertEqual(breaker.retryAfter(), 5)
+
+        clock.now += 5
+        self.assertFalse(breaker.isOpen())
+        self.assertEqual(breaker.retryAfter(), 0)
+
+    def test_failed_starts_back_off_exponentially(self):
+        backend = FakeBackend('a', ready=False)
+        manager, clock = makeManager(backend)
+        breaker = manager.getCircuitBreaker('server:a')
+
+        self.assertIs(manager.getBackend('server:a'), False)
+        self.assertEqual(breaker.failures, 1)
+        self.assertEqual(breaker.retryAfter(), manager.retry_base_delay)
+
+        # an open breaker fails fast without trying again
+        self.assertIs(manager.getBackend('server:a'), False)
+        self.assertEqual(backend.starts, 1)
+
+        clock.now += manager.retry_base_delay
+        self.assertIs(manager.getBackend('server:a'), False)
+        self.assertEqual(breaker.failures, 2)
+        self.assertEqual(breaker.retryAfter(), 2 * manager.retry_base_delay)
+        self.assertEqual(manager.getUnavailability('server:a'), ("a did not start.", 2 * manager.retry_base_delay))
+
+    def test_success_closes_the_breaker(self):
+        backend = FakeBackend('a', ready=False)
+        manager, clock = makeManager(backend)
+
+        manager.getBackend('server:a')
+        clock.now += manager.retry_base_delay
+        backend.ready = True
+
+        self.assertIs(manager.getBackend('server:a'), backend)
+        self.assertEqual(manager.getCircuitBreaker('server:a').failures, 0)
+        self.assertIs(manager.getResidency('server:a'), Residency.HOT)
+
+    def test_exception_takes_the_failure_path(self):
+        backend = FakeBackend('a', ready=OSError("boom"))
+        manager, _ = makeManager(backend)
+
+        self.assertIs(manager.getBackend('server:a'), False)
+        self.assertIs(manager.getResidency('server:a'), Residency.COLD)
+        self.assertEqual(manager.getCircuitBreaker('server:a').failures, 1)
+        self.assertIn("boom", manager.getCircuitBreaker('server:a').last_error)
+
+
+class SwapTest(unittest.TestCase):
+    def test_swap_stops_the_other_backend(self):
+        a, b = FakeBackend('a'), FakeBackend('b')
+        manager, _ = makeManager(a, b)
+
+        manager.getBackend('server:a')
+        manager.getBackend('server:b')
+
+        self.assertEqual(a.stops, 1)
+        self.assertIs(manager.getResidency('server:a'), Residency.COLD)
+        self.assertIs(manager.getResidency('server:b'), Residency.HOT)
+        self.assertEqual(manager.getActive(), 'server:b')
+
+    def test_resident_backend_answers_while_a_swap_waits(self):
+        a, b = FakeBackend('a'), FakeBackend('b')
+        a.eviction_wait = 5.0
+        manager, _ = makeManager(a, b)
+        manager.getBackend('server:a')
+
+        a.idle.clear()
+        swap = threading.Thread(target=manager.getBackend, args=('server:b',))
+        swap.start()
+
+        # the swap waits for a's jobs without holding the lock
+        self.assertIs(manager.getBackend('server:a'), a)
+        a.idle.set()
+        swap.join()
+
+        self.assertIs(manager.getResidency('server:b'), Residency.HOT)
+
+
+class PinAndDrainTest(unittest.TestCase):
+    def test_pinned_tenant_is_not_evicted(self):
+        a, b = FakeBackend('a'), FakeBackend('b')
+        manager, clock = makeManager(a, b)
+
+        manager.getBackend('server:a')
+        manager.pin('server:a', 60)
+
+        self.assertIs(manager.getBackend('server:b'), False)
+        self.assertEqual(manager.getUnavailability('server:b'), ("a is pinned.", 60))
+        self.assertEqual(a.stops, 0)
+
+        clock.now += 60
+        self.assertIs(manager.getBackend('server:b'), b)
+
+    def test_draining_backend_refuses_requests(self):
+        a = FakeBackend('a')
+        manager, _ = makeManager(a)
+        manager.getBackend('server:a')
+
+        a.idle.clear()
+        drain = threading.Thread(target=manager.drain, args=('server:a', 5.0))
+        drain.start()
+
+        while manager.getUnavailability('server:a')[0] != "a is being drained.":
+            pass
+        self.assertIs(manager.getBackend('server:a'), False)
+
+        a.idle.set()
+        drain.join()
+
+        self.assertIs(manager.getResidency('server:a'), Residency.COLD)
+        self.assertIs(manager.getBackend('server:a'), a)
+
+    def test_overlapping_drains(self):
+        a = FakeBackend('a')
+        manager, _ = makeManager(a)
+        manager.getBackend('server:a')
+
+        a.idle.clear()
+        drains = [threading.Thread(target=manager.drain, args=('server:a', timeout)) for timeout in (5.0, 10.0)]
+        for drain in drains:
+            drain.start()
+
+        a.idle.set()
+        for drain in drains:
+            drain.join()
+
+        self.assertIs(manager.getBackend('server:a'), a)
+
+    def test_unknown_endpoint(self):
+        manager, _ = makeManager(FakeBackend('a'))
+
+        with self.assertRaises(ValueError):
+            manager.pin('server:b', 60)
+        with self.assertRaises(ValueError):
+            manager.drain('server:b', 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
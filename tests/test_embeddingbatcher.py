@@ -0,0 +1,99 @@
+import json
+import threading
+import unittest
+
+from typing import Dict, List
+
+from src.config import EmbeddingBatchingConfig
+from src.embeddingbatcher import EmbeddingBatcher
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.requests: List[Dict] = []
+        self.headers: List[Dict] = []
+
+    def __call__(self, path: str, request: Dict, headers: Dict[str, str]):
+        self.requests.append(request)
+        self.headers.append(headers)
+
+        data = [{'object': 'embedding', 'index': index, 'embedding': [len(text)]} for index, text in enumerate(request['input'])]
+        body = {'object': 'list', 'data': data, 'usage': {'prompt_tokens': 10 * len(data), 'total_tokens': 10 * len(data)}}
+        return 200, 'application/json', json.dumps(body).encode('utf-8')
+
+
+def submitTogether(batcher: EmbeddingBatcher, requests: List[tuple]) -> List[Dict]:
+    results: List = [None] * len(requests)
+
+    def submit(index: int, request: Dict, headers: Dict[str, str]):
+        _, _, body = batcher.submit('/v1/embeddings', request, headers)
+        results[index] = json.loads(body)
+
+    threads = [threading.Thread(target=submit, args=(index, request, headers)) for index, (request, headers) in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+class EmbeddingBatcherTest(unittest.TestCase):
+    def test_identical_inputs_are_embedded_once(self):
+        upstream = FakeUpstream()
+        batcher = EmbeddingBatcher(EmbeddingBatchingConfig(max_batch_size=8, max_wait_ms=50), upstream)
+
+        results = submitTogether(batcher, [
+            ({'model': 'm', 'input': ['a', 'bb']}, {}),
+            ({'model': 'm', 'input': 'bb'}, {}),
+        ])
+
+        self.assertEqual(len(upstream.requests), 1)
+        self.assertEqual(sorted(upstream.requests[0]['input']), ['a', 'bb'])
+        self.assertEqual([item['embedding'] for item in results[0]['data']], [[1], [2]])
+        self.assertEqual([item['embedding'] for item in results[1]['data']], [[2]])
+
+    def test_usage_is_split_by_the_number_of_inputs(self):
+        upstream = FakeUpstream()
+        batcher = EmbeddingBatcher(EmbeddingBatchingConfig(max_batch_size=8, max_wait_ms=50), upstream)
+
+        results = submitTogether(batcher, [
+            ({'model': 'm', 'input': ['a', 'b', 'c']}, {}),
+            ({'model': 'm', 'input': 'd'}, {}),
+        ])
+
+        usages = sorted(result['usage']['prompt_tokens'] for result in results)
+        self.assertEqual(usages, [10, 30])
+
+    def test_requests_with_other_credentials_are_not_batched_together(self):
+        upstream = FakeUpstream()
+        batcher = EmbeddingBatcher(EmbeddingBatchingConfig(max_batch_size=8, max_wait_ms=50), upstream)
+
+        submitTogether(batcher, [
+            ({'model': 'm', 'input': 'a'}, {'Authorization': 'Bearer one'}),
+            ({'model': 'm', 'input': 'b'}, {'Authorization': 'Bearer two'}),
+        ])
+
+        self.assertEqual(len(upstream.requests), 2)
+        self.assertEqual(sorted(headers['Authorization'] for headers in upstream.headers), ['Bearer one', 'Bearer two'])
+
+    def test_full_batch_is_sent_at_once(self):
+        upstream = FakeUpstream()
+        batcher = EmbeddingBatcher(EmbeddingBatchingConfig(max_batch_size=2, max_wait_ms=60000), upstream)
+
+        status, _, _ = batcher.submit('/v1/embeddings', {'model': 'm', 'input': ['a', 'b']})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(upstream.requests), 1)
+
+    def test_invalid_requests(self):
+        batcher = EmbeddingBatcher(EmbeddingBatchingConfig(), FakeUpstream())
+
+        with self.assertRaises(ValueError):
+            batcher.submit('/v1/embeddings', ['a'])
+        with self.assertRaises(ValueError):
+            batcher.submit('/v1/embeddings', {'input': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import unittest
+
+from src.config import EndpointConfig
+from src.gateway import findEndpoint, isGatewayPath, modelCatalog, modelEntry, modelNotFound, requestedModel
+
+
+ENDPOINTS = [
+    EndpointConfig('chat', 'llamacpp', '/chat', models=['llama', 'shared']),
+    EndpointConfig('other', 'koboldcpp', '/other', models=['shared', 'mistral']),
+    EndpointConfig('embed', 'llamacpp', '/embed'),
+]
+
+
+class GatewayTest(unittest.TestCase):
+    def test_gateway_paths(self):
+        self.assertTrue(isGatewayPath('/v1/chat/completions'))
+        self.assertTrue(isGatewayPath('/v1/embeddings?x=1'))
+        self.assertFalse(isGatewayPath('/v1/models'))
+        self.assertFalse(isGatewayPath('/chat/v1/chat/completions'))
+
+    def test_requested_model(self):
+        self.assertEqual(requestedModel(b'{"model": "llama", "messages": []}'), 'llama')
+        self.assertIsNone(requestedModel(b'{"messages": []}'))
+        self.assertIsNone(requestedModel(b'{"model": 1}'))
+        self.assertIsNone(requestedModel(b'[]'))
+        self.assertIsNone(requestedModel(b'not json'))
+        self.assertIsNone(requestedModel(b'\xff'))
+
+    def test_routing_by_model(self):
+        self.assertEqual(findEndpoint(ENDPOINTS, 'llama').name, 'chat')
+        self.assertEqual(findEndpoint(ENDPOINTS, 'mistral').name, 'other')
+        # endpoints without models are selected by their name
+        self.assertEqual(findEndpoint(ENDPOINTS, 'embed').name, 'embed')
+        # a model served by several endpoints goes to the first one
+        self.assertEqual(findEndpoint(ENDPOINTS, 'shared').name, 'chat')
+        self.assertIsNone(findEndpoint(ENDPOINTS, 'chat'))
+
+    def test_catalog_lists_every_model_once(self):
+        catalog = json.loads(modelCatalog(ENDPOINTS))
+
+        self.assertEqual(catalog['object'], 'list')
+        self.assertEqual([model['id'] for model in catalog['data']], ['llama', 'shared', 'mistral', 'embed'])
+        self.assertEqual(catalog['data'][2]['owned_by'], 'koboldcpp')
+
+    def test_model_entry(self):
+        self.assertEqual(json.loads(modelEntry(ENDPOINTS, 'mistral'))['owned_by'], 'koboldcpp')
+        self.assertIsNone(modelEntry(ENDPOINTS, 'unknown'))
+
+    def test_model_not_found(self):
+        error = json.loads(modelNotFound('unknown'))['error']
+
+        self.assertEqual(error['code'], 'model_not_found')
+        self.assertIn('unknown', error['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
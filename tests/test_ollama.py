@@ -0,0 +1,94 @@
+import http.server
+import json
+import socketserver
+import subprocess
+import sys
+import textwrap
+import threading
+import unittest
+
+from pathlib import Path
+
+from src.backends.ollama import Ollama
+from src.config import AIBackendConfig, ServerConfig
+
+
+class FakeOllamaHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.reply(200, {'version': '0.0.0'} if self.path == '/api/version' else {})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        getattr(self.server, 'requests').append((self.path, request))
+
+        # embedding models only load through /embed
+        if self.path == '/api/generate' and request['model'].startswith('embed') and request['keep_alive'] != 0:
+            self.reply(400, {'error': 'does not support generate'})
+        else:
+            self.reply(200, {})
+
+    def reply(self, status: int, data: dict):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class OllamaTest(unittest.TestCase):
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeOllamaHandler)
+        self.server.daemon_threads = True
+        setattr(self.server, 'requests', [])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def makeBackend(self, models: list) -> Ollama:
+        server = ServerConfig('test', '127.0.0.1', 0, [{'name': 'chat', 'backend': 'ollama', 'models': models}])
+        return Ollama(AIBackendConfig('ollama', attach_to=self.url), server, server.endpoints[0])
+
+    def test_ready_preloads_every_model(self):
+        backend = self.makeBackend(['llama', 'embed-text'])
+
+        self.assertTrue(backend.readyService())
+        self.assertTrue(backend.isAttached())
+        self.assertTrue(backend.models_preloaded)
+
+        requests = getattr(self.server, 'requests')
+        self.assertIn(('/api/generate', {'model': 'llama', 'keep_alive': -1}), requests)
+        self.assertIn(('/api/embed', {'model': 'embed-text', 'keep_alive': -1, 'input': []}), requests)
+
+    def test_start_then_request_after_the_main_thread_returned(self):
+        # the backend is readied by a request handler thread, after the main thread is done starting the servers
+        script = textwrap.dedent(f'''
+            import threading
+            from src.backends.ollama import Ollama
+            from src.config import AIBackendConfig, ServerConfig
+
+            server = ServerConfig('test', '127.0.0.1', 0, [{{'name': 'chat', 'backend': 'ollama', 'models': ['llama', 'mistral']}}])
+            backend = Ollama(AIBackendConfig('ollama', attach_to={self.url!r}), server, server.endpoints[0])
+
+            def request():
+                threading.main_thread().join()
+                print('ready' if backend.readyService() and backend.models_preloaded else 'failed')
+
+            threading.Thread(target=request).start()
+        ''')
+
+        result = subprocess.run([sys.executable, '-c', script], cwd=Path(__file__).parent.parent, capture_output=True, text=True, timeout=30)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.splitlines()[-1], 'ready', result.stderr)
+        self.assertNotIn('Traceback', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
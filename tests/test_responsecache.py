@@ -0,0 +1,86 @@
+import json
+import time
+import unittest
+
+from src.config import EndpointConfig, ResponseCacheConfig
+from src.responsecache import CachedResponse, ResponseCache, forwardedHeaders, staticResponse
+
+
+def response(body: bytes, stored_at: float|None = None) -> CachedResponse:
+    return CachedResponse(200, 'application/json', body, time.monotonic() if stored_at is None else stored_at)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_expired_entries_are_dropped(self):
+        cache = ResponseCache(ResponseCacheConfig(ttl=60))
+        cache.put('fresh', response(b'1'))
+        cache.put('stale', response(b'2', time.monotonic() - 61))
+
+        self.assertEqual(cache.get('fresh').body, b'1')
+        self.assertIsNone(cache.get('stale'))
+        self.assertEqual(cache._size, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResponseCache(ResponseCacheConfig(max_entries=2))
+        cache.put('a', response(b'a'))
+        cache.put('b', response(b'b'))
+        cache.get('a')
+        cache.put('c', response(b'c'))
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_size_limit(self):
+        cache = ResponseCache(ResponseCacheConfig(max_size_mb=1))
+        megabyte = 1024 * 1024
+
+        cache.put('a', response(b'a' * (megabyte // 2)))
+        cache.put('b', response(b'b' * (megabyte // 2)))
+        cache.put('c', response(b'c' * 10))
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('b'))
+
+        # a response bigger than the whole cache is not stored, and evicts nothing
+        cache.put('d', response(b'd' * (megabyte + 1)))
+        self.assertIsNone(cache.get('d'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertLessEqual(cache._size, megabyte)
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = ResponseCache(ResponseCacheConfig(enabled=False))
+        cache.put('a', response(b'a'))
+
+        self.assertIsNone(cache.get('a'))
+
+    def test_key_depends_on_body_and_credentials(self):
+        key = ResponseCache.key('s:e', 'POST', '/tokenize', b'{"content": "a"}', 'Bearer one')
+
+        self.assertEqual(key, ResponseCache.key('s:e', 'POST', '/tokenize', b'{"content": "a"}', 'Bearer one'))
+        self.assertNotEqual(key, ResponseCache.key('s:e', 'POST', '/tokenize', b'{"content": "b"}', 'Bearer one'))
+        self.assertNotEqual(key, ResponseCache.key('s:e', 'POST', '/tokenize', b'{"content": "a"}', 'Bearer two'))
+
+    def test_hop_by_hop_headers_are_not_forwarded(self):
+        headers = {'Authorization': 'Bearer one', 'Connection': 'keep-alive', 'Accept-Encoding': 'gzip', 'Host': 'localhost'}
+
+        self.assertEqual(forwardedHeaders(headers), {'Authorization': 'Bearer one'})
+
+
+class StaticResponseTest(unittest.TestCase):
+    def test_literal_responses(self):
+        endpoint = EndpointConfig('e', 'llamacpp', '/e', static_responses={'/health': {'status': 'ok'}})
+
+        self.assertEqual(json.loads(staticResponse(endpoint, '/health?x=1')), {'status': 'ok'})
+        self.assertIsNone(staticResponse(endpoint, '/v1/models'))
+
+    def test_model_list_is_built_from_the_endpoint_models(self):
+        endpoint = EndpointConfig('e', 'llamacpp', '/e', models=['small', 'large'])
+
+        catalog = json.loads(staticResponse(endpoint, '/v1/models'))
+        self.assertEqual([model['id'] for model in catalog['data']], ['small', 'large'])
+        self.assertEqual(json.loads(staticResponse(endpoint, '/v1/models/large'))['id'], 'large')
+        self.assertIsNone(staticResponse(endpoint, '/v1/models/other'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import http.client
+import http.server
+import json
+import socketserver
+import threading
+import unittest
+
+from src.aibackendmanager import getBackendManager, setBackendManager
+from src.config import ServerConfig
+from src.server import AIAPIHandler
+
+
+class EchoHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        response = json.dumps({'path': self.path, 'body': body.decode('utf-8'), 'host': self.headers['Host']}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class QuietHandler(AIAPIHandler):
+    def log_message(self, *args):
+        pass
+
+
+class FakeBackend:
+    def __init__(self, url: str):
+        self.url = url
+
+    def backendURL(self) -> str:
+        return self.url
+
+
+class FakeManager:
+    def __init__(self, backend: FakeBackend|None):
+        self.backend = backend
+
+    def getBackend(self, server_endpoint: str, estimate=None):
+        return self.backend if self.backend is not None else False
+
+    def getUnavailability(self, server_endpoint: str):
+        return "Backend could not be started", 5.0
+
+
+def serve(server: socketserver.TCPServer):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = socketserver.ThreadingTCPServer(('127.0.0.1', 0), EchoHandler)
+        self.upstream.daemon_threads = True
+        serve(self.upstream)
+        self.upstream_url = f'http://127.0.0.1:{self.upstream.server_address[1]}'
+
+        self.previous_manager = getBackendManager()
+        setBackendManager(FakeManager(FakeBackend(self.upstream_url)))
+
+        self.juggler = socketserver.ThreadingTCPServer(('127.0.0.1', 0), QuietHandler)
+        self.juggler.daemon_threads = True
+        setattr(self.juggler, 'server_config', ServerConfig('test', '127.0.0.1', self.juggler.server_address[1], [
+            {'name': 'relay', 'backend': 'llamacpp', 'path_prefix': '/relay', 'strip_prefix': True, 'passthrough': True},
+            {'name': 'redirect', 'backend': 'llamacpp', 'path_prefix': '/redirect', 'strip_prefix': True},
+        ]))
+        serve(self.juggler)
+
+    def tearDown(self):
+        setBackendManager(self.previous_manager)
+        for server in (self.juggler, self.upstream):
+            server.shutdown()
+            server.server_close()
+
+    def request(self, method: str, path: str, body: bytes|None = None) -> http.client.HTTPResponse:
+        connection = http.client.HTTPConnection('127.0.0.1', self.juggler.server_address[1], timeout=10)
+        self.addCleanup(connection.close)
+        connection.request(method, path, body=body)
+        return connection.getresponse()
+
+    def test_passthrough_strips_the_prefix(self):
+        response = self.request('POST', '/relay/v1/completions?stream=1', b'{"prompt": "hi"}')
+        echoed = json.loads(response.read())
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(echoed['path'], '/v1/completions?stream=1')
+        self.assertEqual(echoed['body'], '{"prompt": "hi"}')
+        self.assertEqual(echoed['host'], self.upstream_url.removeprefix('http://'))
+
+    def test_passthrough_of_the_bare_prefix_sends_the_root(self):
+        response = self.request('GET', '/relay')
+
+        self.assertEqual(json.loads(response.read())['path'], '/')
+
+    def test_redirect_strips_the_prefix(self):
+        response = self.request('GET', '/redirect/health')
+
+        self.assertEqual(response.status, 307)
+        self.assertEqual(response.getheader('Location'), f'{self.upstream_url}/health')
+
+    def test_unavailable_backend(self):
+        setBackendManager(FakeManager(None))
+        response = self.request('GET', '/redirect/health')
+
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.getheader('Retry-After'), '5')
+
+    def test_unknown_endpoint(self):
+        self.assertEqual(self.request('GET', '/unknown').status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()